@@ -7,6 +7,7 @@ Handles email sending for invoice delivery, payment notifications, and reminders
 import asyncio
 import json
 import logging
+import os
 import smtplib
 from datetime import datetime, timedelta
 from email.mime.application import MIMEApplication
@@ -19,6 +20,10 @@ from email_validator import validate_email, EmailNotValidError
 
 logger = logging.getLogger(__name__)
 
+# live smtp connections kept per manager; each send reuses one instead of a fresh tls handshake + login
+SMTP_CONCURRENCY = int(os.environ.get("SMTP_CONCURRENCY", "4"))
+SMTP_MAX_ATTEMPTS = 3
+
 
 class EmailTemplate:
     """Email template model."""
@@ -97,6 +102,11 @@ class EmailManager:
         
         self.templates: Dict[str, EmailTemplate] = {}
         self.email_log: List[Dict] = []
+        
+        # idle authenticated connections, and a cap on how many are open at once
+        self._smtp_idle: List[aiosmtplib.SMTP] = []
+        self._smtp_slots = asyncio.Semaphore(SMTP_CONCURRENCY)
+        
         self.load_data()
         self._create_default_templates()
     
@@ -470,15 +480,7 @@ class EmailManager:
             }
         
         try:
-            # Use aiosmtplib for async email sending
-            await aiosmtplib.send(
-                msg,
-                hostname=self.smtp_server,
-                port=self.smtp_port,
-                start_tls=True,
-                username=self.username,
-                password=self.password,
-            )
+            await self._send_pooled(msg)
             
             logger.info(f"Email sent successfully to {to_email}")
             return {"success": True, "message": f"Email sent to {to_email}"}
@@ -487,6 +489,62 @@ class EmailManager:
             logger.error(f"Failed to send email to {to_email}: {e}")
             return {"success": False, "error": str(e)}
     
+    async def _send_pooled(self, msg: MIMEMultipart) -> None:
+        """send over a pooled connection, retrying dropped connections and transient 4xx replies."""
+        for attempt in range(SMTP_MAX_ATTEMPTS):
+            last_attempt = attempt == SMTP_MAX_ATTEMPTS - 1
+            try:
+                async with self._smtp_slots:
+                    await self._send_once(msg)
+                return
+            except aiosmtplib.SMTPResponseException as e:
+                if not 400 <= e.code < 500 or last_attempt:
+                    raise
+                # back off after giving the slot back, so other sends aren't stalled behind this one
+                await asyncio.sleep(2 ** attempt)
+            except aiosmtplib.SMTPServerDisconnected:
+                # idle connections get dropped by the server; reconnect and try again
+                if last_attempt:
+                    raise
+    
+    async def _send_once(self, msg: MIMEMultipart) -> None:
+        """send on one connection; only a clean send puts it back in the pool."""
+        smtp = await self._acquire_smtp()
+        try:
+            await smtp.send_message(msg)
+        except BaseException:
+            # the session state is unknown after a failed send, so never reuse it
+            smtp.close()
+            raise
+        self._smtp_idle.append(smtp)
+    
+    async def _acquire_smtp(self) -> aiosmtplib.SMTP:
+        """take an idle connection, or open and log in a new one."""
+        while self._smtp_idle:
+            smtp = self._smtp_idle.pop()
+            if smtp.is_connected:
+                return smtp
+        
+        smtp = aiosmtplib.SMTP(
+            hostname=self.smtp_server,
+            port=self.smtp_port,
+            start_tls=True,
+            username=self.username,
+            password=self.password,
+        )
+        # connect also runs starttls and login
+        await smtp.connect()
+        return smtp
+    
+    async def close(self) -> None:
+        """close any idle smtp connections."""
+        while self._smtp_idle:
+            smtp = self._smtp_idle.pop()
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+    
     def get_email_templates(self) -> List[Dict]:
         """Get all email templates."""
         return [
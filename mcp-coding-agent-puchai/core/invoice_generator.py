@@ -4,10 +4,16 @@ invoice generator for invoice pdf generator
 generates professional invoice pdfs using reportlab.
 """
 
+import asyncio
+import functools
 import io
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date as date_cls, datetime, timedelta
+from typing import Annotated, Dict, Optional, Union
 
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
@@ -18,10 +24,91 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
 from PIL import Image
 import qrcode
+from pydantic import BaseModel, Field, TypeAdapter
 
 logger = logging.getLogger(__name__)
 
 
+class InvoiceItem(BaseModel):
+    """a single invoice line item."""
+    name: str
+    quantity: Annotated[Union[int, float], Field(gt=0)]
+    rate: Annotated[Union[int, float], Field(gt=0)]
+
+
+# parses and validates an items payload in a single pass
+ITEMS_ADAPTER = TypeAdapter(list[InvoiceItem])
+
+
+class InvoiceRequest(BaseModel):
+    """validated parameters for a multi-item invoice."""
+    buyer_name: Annotated[str, Field(pattern=r"\S")]
+    company_name: Annotated[str, Field(pattern=r"\S")]
+    items: Annotated[list[InvoiceItem], Field(min_length=1)]
+    date: str
+    tax_rate: float = 0.0
+    currency_symbol: str = "₹"
+    
+    @functools.cached_property
+    def subtotal(self) -> float:
+        """sum of quantity x rate over the items (computed once per request)."""
+        return sum(item.quantity * item.rate for item in self.items)
+
+
+# payment terms on invoices
+DUE_OFFSET = timedelta(days=30)
+
+# fixed table styles shared by every render (setStyle only reads the commands)
+_HEADER_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+    ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+])
+
+_DETAILS_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 15),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 15),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
+    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
+    ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#2b77ad')),
+])
+
+_PAYMENT_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0fff4')),
+    ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#38a169')),
+    ('LEFTPADDING', (0, 0), (-1, -1), 20),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 20),
+    ('TOPPADDING', (0, 0), (-1, -1), 20),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
+    ('LINEBELOW', (0, 0), (-1, 0), 3, colors.HexColor('#38a169')),
+])
+
+_FALLBACK_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fff5f5')),
+    ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#f56565')),
+    ('LEFTPADDING', (0, 0), (-1, -1), 20),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 20),
+    ('TOPPADDING', (0, 0), (-1, -1), 20),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
+])
+
+_PAYMENT_INFO_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f7fafc')),
+    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e0')),
+    ('LEFTPADDING', (0, 0), (-1, -1), 20),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 20),
+    ('TOPPADDING', (0, 0), (-1, -1), 15),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+])
+
+
 class InvoiceGenerator:
     """generates professional invoice pdfs."""
     
@@ -107,28 +194,99 @@ class InvoiceGenerator:
             borderPadding=12,
             backColor=colors.HexColor('#f0fff4'),
         )
+        
+        self.payment_style = ParagraphStyle(
+            'PaymentInstructions',
+            parent=self.styles['Normal'],
+            fontSize=12,
+            spaceAfter=6,
+            textColor=colors.HexColor('#2d3748'),
+            fontName='Helvetica',
+            alignment=TA_LEFT,
+            leftIndent=10,
+        )
+        
+        self.payment_info_style = ParagraphStyle(
+            'PaymentInfo',
+            parent=self.styles['Normal'],
+            fontSize=11,
+            spaceAfter=6,
+            textColor=colors.HexColor('#4a5568'),
+            fontName='Helvetica',
+            alignment=TA_LEFT,
+            leftIndent=15,
+        )
+        
+        self.terms_style = ParagraphStyle(
+            'TermsStyle',
+            parent=self.styles['Normal'],
+            fontSize=10,
+            spaceAfter=6,
+            textColor=colors.HexColor('#4a5568'),
+            fontName='Helvetica',
+            alignment=TA_LEFT,
+        )
+        
+        # bills use a slightly larger terms font than invoices
+        self.bill_terms_style = ParagraphStyle(
+            'BillTermsStyle',
+            parent=self.terms_style,
+            fontSize=11,
+        )
+        
+        self.footer_style = ParagraphStyle(
+            'EnhancedFooter',
+            parent=self.styles['Normal'],
+            fontSize=9,
+            textColor=colors.HexColor('#718096'),
+            alignment=TA_CENTER,
+            borderWidth=1,
+            borderColor=colors.HexColor('#e2e8f0'),
+            borderPadding=8,
+            backColor=colors.HexColor('#f7fafc'),
+        )
     
     
     def _generate_invoice_number(self, generation_id: str) -> str:
         """generate a unique invoice number."""
         # Use timestamp from generation_id for consistency
-        timestamp = generation_id.split('_')[1] if '_' in generation_id else generation_id
-        return f"INV-{timestamp}"
+        _, sep, timestamp = generation_id.partition('_')
+        return f"INV-{timestamp if sep else generation_id}"
     
-    def _calculate_due_date(self, invoice_date: str, days: int = 30) -> str:
+    def _calculate_due_date(self, invoice_date: str, offset: timedelta = DUE_OFFSET) -> str:
         """calculate due date from invoice date."""
         try:
-            date_obj = datetime.strptime(invoice_date, "%Y-%m-%d")
-            due_date = date_obj + timedelta(days=days)
-            return due_date.strftime("%Y-%m-%d")
+            # dates arrive validated as YYYY-MM-DD, which fromisoformat reads without strptime's format parsing
+            due_date = date_cls.fromisoformat(invoice_date) + offset
         except ValueError:
             # Fallback to 30 days from today
-            due_date = datetime.now() + timedelta(days=days)
-            return due_date.strftime("%Y-%m-%d")
+            due_date = date_cls.today() + offset
+        return due_date.isoformat()
     
     async def generate_multi_item_invoice_pdf(
         self,
-        items: list,
+        items: list[InvoiceItem],
+        buyer_name: str,
+        company_name: str,
+        date: str,
+        generation_id: str,
+        tax_rate: float = 0.0,
+        currency_symbol: str = "₹"
+    ) -> bytes:
+        """Render a multi-item invoice PDF in the process pool, off the event loop."""
+        return await _render_in_pool("build_multi_item_invoice_pdf", dict(
+            items=items,
+            buyer_name=buyer_name,
+            company_name=company_name,
+            date=date,
+            generation_id=generation_id,
+            tax_rate=tax_rate,
+            currency_symbol=currency_symbol
+        ))
+    
+    def build_multi_item_invoice_pdf(
+        self,
+        items: list[InvoiceItem],
         buyer_name: str,
         company_name: str,
         date: str,
@@ -144,6 +302,8 @@ class InvoiceGenerator:
         logger.info(f"[{generation_id}] Generating enhanced multi-item PDF for {buyer_name} - {len(items)} items")
         
         try:
+            invoice_number = self._generate_invoice_number(generation_id)
+            
             # Create PDF in memory with enhanced settings
             buffer = io.BytesIO()
             doc = SimpleDocTemplate(
@@ -153,7 +313,8 @@ class InvoiceGenerator:
                 leftMargin=60,
                 topMargin=60,
                 bottomMargin=60,
-                title=f"Invoice {self._generate_invoice_number(generation_id)}"
+                title=f"Invoice {invoice_number}",
+                pageCompression=1  # FlateDecode content streams
             )
             
             # Build invoice content
@@ -166,18 +327,10 @@ class InvoiceGenerator:
             ]]
             
             header_table = Table(header_data, colWidths=[4*inch, 3*inch])
-            header_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-                ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ]))
+            header_table.setStyle(_HEADER_TABLE_STYLE)
             story.append(header_table)
             story.append(Spacer(1, 20))
             
-            # Invoice metadata in professional layout
-            invoice_number = self._generate_invoice_number(generation_id)
-            due_date = self._calculate_due_date(date)
-            
             # Create two-column layout for invoice details
             left_column_data = [
                 [Paragraph("<b>BILL TO:</b>", self.section_header_style)],
@@ -200,18 +353,7 @@ class InvoiceGenerator:
                 details_layout.append([left_cell, right_cell])
             
             details_table = Table(details_layout, colWidths=[3.5*inch, 3.5*inch])
-            details_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 15),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-                ('TOPPADDING', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
-                ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#2b77ad')),
-            ]))
+            details_table.setStyle(_DETAILS_TABLE_STYLE)
             
             story.append(details_table)
             story.append(Spacer(1, 30))
@@ -227,9 +369,9 @@ class InvoiceGenerator:
             # Add each item as a separate row with enhanced formatting
             subtotal = 0
             for item in items:
-                item_name = item['name']
-                quantity = item['quantity']
-                rate = item['rate']
+                item_name = item.name
+                quantity = item.quantity
+                rate = item.rate
                 amount = quantity * rate
                 subtotal += amount
                 
@@ -305,36 +447,14 @@ class InvoiceGenerator:
             about this invoice or need assistance, please don't hesitate to contact us.
             """
             
-            terms_style = ParagraphStyle(
-                'TermsStyle',
-                parent=self.styles['Normal'],
-                fontSize=11,
-                spaceAfter=6,
-                textColor=colors.HexColor('#4a5568'),
-                fontName='Helvetica',
-                alignment=TA_LEFT,
-            )
-            
-            story.append(Paragraph(terms_text, terms_style))
+            story.append(Paragraph(terms_text, self.bill_terms_style))
             
             # Enhanced Footer
             story.append(Spacer(1, 30))
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             footer_text = f"📄 Generated on {current_time} | Invoice ID: {generation_id}"
             
-            footer_style = ParagraphStyle(
-                'EnhancedFooter',
-                parent=self.styles['Normal'],
-                fontSize=9,
-                textColor=colors.HexColor('#718096'),
-                alignment=TA_CENTER,
-                borderWidth=1,
-                borderColor=colors.HexColor('#e2e8f0'),
-                borderPadding=8,
-                backColor=colors.HexColor('#f7fafc'),
-            )
-            
-            story.append(Paragraph(footer_text, footer_style))
+            story.append(Paragraph(footer_text, self.footer_style))
             
             # Build PDF with enhanced settings
             doc.build(story)
@@ -380,7 +500,32 @@ class InvoiceGenerator:
     
     async def generate_invoice_with_payment(
         self,
-        items: list,
+        items: list[InvoiceItem],
+        buyer_name: str,
+        company_name: str,
+        date: str,
+        generation_id: str,
+        payment_url: str = "",
+        tax_rate: float = 0.0,
+        currency_symbol: str = "₹",
+        buyer_email: str = ""
+    ) -> bytes:
+        """Render a payment-enabled invoice PDF in the process pool, off the event loop."""
+        return await _render_in_pool("build_invoice_with_payment_pdf", dict(
+            items=items,
+            buyer_name=buyer_name,
+            company_name=company_name,
+            date=date,
+            generation_id=generation_id,
+            payment_url=payment_url,
+            tax_rate=tax_rate,
+            currency_symbol=currency_symbol,
+            buyer_email=buyer_email
+        ))
+    
+    def build_invoice_with_payment_pdf(
+        self,
+        items: list[InvoiceItem],
         buyer_name: str,
         company_name: str,
         date: str,
@@ -398,6 +543,8 @@ class InvoiceGenerator:
         logger.info(f"[{generation_id}] Generating enhanced payment-enabled PDF for {buyer_name} - {len(items)} items")
         
         try:
+            invoice_number = self._generate_invoice_number(generation_id)
+            
             # Create PDF in memory with enhanced settings
             buffer = io.BytesIO()
             doc = SimpleDocTemplate(
@@ -407,7 +554,8 @@ class InvoiceGenerator:
                 leftMargin=60,
                 topMargin=60,
                 bottomMargin=60,
-                title=f"Invoice {self._generate_invoice_number(generation_id)}"
+                title=f"Invoice {invoice_number}",
+                pageCompression=1  # FlateDecode content streams
             )
             
             # Build invoice content
@@ -422,16 +570,11 @@ class InvoiceGenerator:
             ]]
             
             header_table = Table(header_data, colWidths=[4*inch, 3*inch])
-            header_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-                ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
-            ]))
+            header_table.setStyle(_HEADER_TABLE_STYLE)
             story.append(header_table)
             story.append(Spacer(1, 20))
             
             # Invoice metadata in professional layout
-            invoice_number = self._generate_invoice_number(generation_id)
             due_date = self._calculate_due_date(date)
             
             # Create two-column layout for invoice details
@@ -460,18 +603,7 @@ class InvoiceGenerator:
                 details_layout.append([left_cell, right_cell])
             
             details_table = Table(details_layout, colWidths=[3.5*inch, 3.5*inch])
-            details_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 15),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-                ('TOPPADDING', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
-                ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#2b77ad')),
-            ]))
+            details_table.setStyle(_DETAILS_TABLE_STYLE)
             
             story.append(details_table)
             story.append(Spacer(1, 30))
@@ -487,9 +619,9 @@ class InvoiceGenerator:
             # Add each item as a separate row with enhanced formatting
             subtotal = 0
             for item in items:
-                item_name = item['name']
-                quantity = item['quantity']
-                rate = item['rate']
+                item_name = item.name
+                quantity = item.quantity
+                rate = item.rate
                 amount = quantity * rate
                 subtotal += amount
                 
@@ -594,35 +726,14 @@ class InvoiceGenerator:
                     All payments are processed through secure, encrypted channels.
                     """
                     
-                    payment_style = ParagraphStyle(
-                        'PaymentInstructions',
-                        parent=self.styles['Normal'],
-                        fontSize=12,
-                        spaceAfter=6,
-                        textColor=colors.HexColor('#2d3748'),
-                        fontName='Helvetica',
-                        alignment=TA_LEFT,
-                        leftIndent=10,
-                    )
-                    
                     # Create enhanced payment table layout
                     payment_data = [[
-                        Paragraph(payment_instructions, payment_style),
+                        Paragraph(payment_instructions, self.payment_style),
                         qr_image
                     ]]
                     
                     payment_table = Table(payment_data, colWidths=[4.5*inch, 2.5*inch])
-                    payment_table.setStyle(TableStyle([
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-                        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0fff4')),
-                        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#38a169')),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 20),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 20),
-                        ('TOPPADDING', (0, 0), (-1, -1), 20),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
-                        ('LINEBELOW', (0, 0), (-1, 0), 3, colors.HexColor('#38a169')),
-                    ]))
+                    payment_table.setStyle(_PAYMENT_TABLE_STYLE)
                     
                     story.append(payment_table)
                     
@@ -640,15 +751,8 @@ class InvoiceGenerator:
                     <font color="red">Note: QR code generation failed. Please use the payment link above.</font>
                     """
                     
-                    fallback_table = Table([[Paragraph(fallback_payment, payment_style)]], colWidths=[7*inch])
-                    fallback_table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fff5f5')),
-                        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#f56565')),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 20),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 20),
-                        ('TOPPADDING', (0, 0), (-1, -1), 20),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 20),
-                    ]))
+                    fallback_table = Table([[Paragraph(fallback_payment, self.payment_style)]], colWidths=[7*inch])
+                    fallback_table.setStyle(_FALLBACK_TABLE_STYLE)
                     
                     story.append(fallback_table)
                 
@@ -670,26 +774,8 @@ class InvoiceGenerator:
                 We're here to help make your payment process smooth and secure.
                 """
                 
-                info_style = ParagraphStyle(
-                    'PaymentInfo',
-                    parent=self.styles['Normal'],
-                    fontSize=11,
-                    spaceAfter=6,
-                    textColor=colors.HexColor('#4a5568'),
-                    fontName='Helvetica',
-                    alignment=TA_LEFT,
-                    leftIndent=15,
-                )
-                
-                info_table = Table([[Paragraph(payment_info, info_style)]], colWidths=[7*inch])
-                info_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f7fafc')),
-                    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#cbd5e0')),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 20),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 20),
-                    ('TOPPADDING', (0, 0), (-1, -1), 15),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-                ]))
+                info_table = Table([[Paragraph(payment_info, self.payment_info_style)]], colWidths=[7*inch])
+                info_table.setStyle(_PAYMENT_INFO_TABLE_STYLE)
                 
                 story.append(info_table)
             
@@ -711,17 +797,7 @@ class InvoiceGenerator:
             about this invoice or need assistance, please don't hesitate to contact us.
             """
             
-            terms_style = ParagraphStyle(
-                'TermsStyle',
-                parent=self.styles['Normal'],
-                fontSize=10,
-                spaceAfter=6,
-                textColor=colors.HexColor('#4a5568'),
-                fontName='Helvetica',
-                alignment=TA_LEFT,
-            )
-            
-            story.append(Paragraph(terms_text, terms_style))
+            story.append(Paragraph(terms_text, self.terms_style))
             
             # Enhanced Footer
             story.append(Spacer(1, 30))
@@ -730,19 +806,7 @@ class InvoiceGenerator:
             if payment_url:
                 footer_text += f" | 💳 Payment-Enabled Invoice"
             
-            footer_style = ParagraphStyle(
-                'EnhancedFooter',
-                parent=self.styles['Normal'],
-                fontSize=9,
-                textColor=colors.HexColor('#718096'),
-                alignment=TA_CENTER,
-                borderWidth=1,
-                borderColor=colors.HexColor('#e2e8f0'),
-                borderPadding=8,
-                backColor=colors.HexColor('#f7fafc'),
-            )
-            
-            story.append(Paragraph(footer_text, footer_style))
+            story.append(Paragraph(footer_text, self.footer_style))
             
             # Build PDF with enhanced settings
             doc.build(story)
@@ -757,3 +821,80 @@ class InvoiceGenerator:
         except Exception as e:
             logger.error(f"[{generation_id}] Failed to generate enhanced payment PDF: {e}")
             raise
+
+
+# reportlab rendering is cpu-bound, so it runs in worker processes. the pool starts lazily
+# inside a running, threaded server; forking that can deadlock a child on locks other threads
+# held, so workers come from a clean forkserver (spawn where forkserver is unavailable).
+# workers also re-import the launching script as __mp_main__, so launchers keep the server
+# import under their __main__ guard (see render_start.py)
+_PDF_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+if _PDF_MP_CONTEXT.get_start_method() == "forkserver":
+    # load reportlab and the render entry points once in the fork server, not per worker
+    _PDF_MP_CONTEXT.set_forkserver_preload([__name__])
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_worker_generator: Optional[InvoiceGenerator] = None
+
+
+def _pdf_worker_count() -> int:
+    """PDF_WORKERS if set, else one per core."""
+    if os.environ.get("PDF_WORKERS"):
+        return max(1, int(os.environ["PDF_WORKERS"]))
+    return os.cpu_count() or 1
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """create the pdf process pool on first use."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=_pdf_worker_count(),
+            mp_context=_PDF_MP_CONTEXT,
+            initializer=_init_pdf_worker
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """stop the pdf worker processes, dropping renders that haven't started."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=True, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _init_pdf_worker() -> None:
+    """build the worker's generator at startup, so styles are built once and before the first render."""
+    global _worker_generator
+    _worker_generator = InvoiceGenerator()
+
+
+def _render_pdf(method: str, kwargs: Dict) -> bytes:
+    """run a generator build method inside a pool worker."""
+    return getattr(_worker_generator, method)(**kwargs)
+
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    """drop a broken pdf pool so the next render starts a fresh one."""
+    global _pdf_pool
+    # every render in flight sees the same broken pool; only the first one replaces it
+    if _pdf_pool is pool:
+        _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _render_in_pool(method: str, kwargs: Dict) -> bytes:
+    """await a pdf build in the process pool."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pdf_pool()
+    try:
+        return await loop.run_in_executor(pool, _render_pdf, method, kwargs)
+    except BrokenProcessPool:
+        # a worker died (oom, crash in reportlab) and took the pool with it; retry once
+        # on a fresh pool rather than failing every invoice until the server restarts
+        logger.warning("PDF worker pool broke during %s; restarting it and retrying once", method)
+        _discard_pdf_pool(pool)
+        return await loop.run_in_executor(_get_pdf_pool(), _render_pdf, method, kwargs)
@@ -7,6 +7,7 @@ Handles dummy payment processing, payment links, and QR code generation.
 import json
 import logging
 import qrcode
+import threading
 import uuid
 from datetime import datetime, timedelta
 from io import BytesIO
@@ -106,6 +107,8 @@ class PaymentProcessor:
         
         self.transactions: Dict[str, PaymentTransaction] = {}
         self.invoices: Dict[str, Dict] = {}
+        # payment links are created from worker threads, so guard ledger mutation and saves
+        self._lock = threading.RLock()
         self.load_data()
     
     def _ensure_data_directory(self):
@@ -138,22 +141,23 @@ class PaymentProcessor:
     
     def save_data(self):
         """Save payment and invoice data."""
-        try:
-            # Save transactions
-            payments_data = {
-                tid: transaction.to_dict()
-                for tid, transaction in self.transactions.items()
-            }
-            with open(self.payments_file, 'w', encoding='utf-8') as f:
-                json.dump(payments_data, f, indent=2, ensure_ascii=False)
-            
-            # Save invoices
-            with open(self.invoices_file, 'w', encoding='utf-8') as f:
-                json.dump(self.invoices, f, indent=2, ensure_ascii=False)
+        with self._lock:
+            try:
+                # Save transactions
+                payments_data = {
+                    tid: transaction.to_dict()
+                    for tid, transaction in self.transactions.items()
+                }
+                with open(self.payments_file, 'w', encoding='utf-8') as f:
+                    json.dump(payments_data, f, indent=2, ensure_ascii=False)
                 
-        except Exception as e:
-            logger.error(f"Failed to save payment data: {e}")
-            raise
+                # Save invoices
+                with open(self.invoices_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.invoices, f, indent=2, ensure_ascii=False)
+                    
+            except Exception as e:
+                logger.error(f"Failed to save payment data: {e}")
+                raise
     
     def create_payment_link(
         self,
@@ -164,78 +168,79 @@ class PaymentProcessor:
         payment_methods: List[str] = None
     ) -> Dict:
         """Create a payment link for an invoice."""
-        try:
-            # Validate inputs
-            if not invoice_id or not invoice_id.strip():
-                raise ValueError("Invoice ID cannot be empty")
-            
-            if amount <= 0:
-                raise ValueError("Amount must be greater than zero")
-            
-            if not currency:
-                currency = "₹"  # Default currency
-            
-            if payment_methods is None:
-                payment_methods = ["card", "upi", "paypal"]
-            
-            logger.info(f"Creating payment link for invoice {invoice_id}, amount: {currency}{amount:.2f}")
-            
-            # Create transaction
-            transaction = PaymentTransaction(
-                invoice_id=invoice_id,
-                amount=amount,
-                currency=currency,
-                customer_email=customer_email
-            )
-            
-            # Create payment URL
-            payment_url = f"{self.base_url}/payment/{transaction.transaction_id}"
-            transaction.payment_url = payment_url
-            
-            # Store transaction
-            self.transactions[transaction.transaction_id] = transaction
-            
-            # Update invoice with payment info
-            if invoice_id not in self.invoices:
-                self.invoices[invoice_id] = {
-                    "invoice_id": invoice_id,
-                    "status": "draft",
+        with self._lock:
+            try:
+                # Validate inputs
+                if not invoice_id or not invoice_id.strip():
+                    raise ValueError("Invoice ID cannot be empty")
+                
+                if amount <= 0:
+                    raise ValueError("Amount must be greater than zero")
+                
+                if not currency:
+                    currency = "₹"  # Default currency
+                
+                if payment_methods is None:
+                    payment_methods = ["card", "upi", "paypal"]
+                
+                logger.info(f"Creating payment link for invoice {invoice_id}, amount: {currency}{amount:.2f}")
+                
+                # Create transaction
+                transaction = PaymentTransaction(
+                    invoice_id=invoice_id,
+                    amount=amount,
+                    currency=currency,
+                    customer_email=customer_email
+                )
+                
+                # Create payment URL
+                payment_url = f"{self.base_url}/payment/{transaction.transaction_id}"
+                transaction.payment_url = payment_url
+                
+                # Store transaction
+                self.transactions[transaction.transaction_id] = transaction
+                
+                # Update invoice with payment info
+                if invoice_id not in self.invoices:
+                    self.invoices[invoice_id] = {
+                        "invoice_id": invoice_id,
+                        "status": "draft",
+                        "amount": amount,
+                        "currency": currency,
+                        "created_at": datetime.now().isoformat()
+                    }
+                
+                self.invoices[invoice_id]["payment_link"] = payment_url
+                self.invoices[invoice_id]["transaction_id"] = transaction.transaction_id
+                self.invoices[invoice_id]["status"] = "pending_payment"
+                
+                # Save data with error handling
+                try:
+                    self.save_data()
+                except Exception as save_error:
+                    logger.error(f"Failed to save payment data: {save_error}")
+                    # Remove transaction from memory if save failed
+                    if transaction.transaction_id in self.transactions:
+                        del self.transactions[transaction.transaction_id]
+                    raise
+                
+                logger.info(f"Created payment link for invoice {invoice_id}: {payment_url}")
+                
+                return {
+                    "transaction_id": transaction.transaction_id,
+                    "payment_url": payment_url,
                     "amount": amount,
                     "currency": currency,
-                    "created_at": datetime.now().isoformat()
+                    "available_methods": [
+                        self.payment_methods[method].name 
+                        for method in payment_methods 
+                        if method in self.payment_methods
+                    ]
                 }
-            
-            self.invoices[invoice_id]["payment_link"] = payment_url
-            self.invoices[invoice_id]["transaction_id"] = transaction.transaction_id
-            self.invoices[invoice_id]["status"] = "pending_payment"
-            
-            # Save data with error handling
-            try:
-                self.save_data()
-            except Exception as save_error:
-                logger.error(f"Failed to save payment data: {save_error}")
-                # Remove transaction from memory if save failed
-                if transaction.transaction_id in self.transactions:
-                    del self.transactions[transaction.transaction_id]
-                raise
-            
-            logger.info(f"Created payment link for invoice {invoice_id}: {payment_url}")
-            
-            return {
-                "transaction_id": transaction.transaction_id,
-                "payment_url": payment_url,
-                "amount": amount,
-                "currency": currency,
-                "available_methods": [
-                    self.payment_methods[method].name 
-                    for method in payment_methods 
-                    if method in self.payment_methods
-                ]
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to create payment link for invoice {invoice_id}: {e}")
-            raise ValueError(f"Payment link creation failed: {str(e)}")
+                
+            except Exception as e:
+                logger.error(f"Failed to create payment link for invoice {invoice_id}: {e}")
+                raise ValueError(f"Payment link creation failed: {str(e)}")
     
     def generate_payment_qr(self, transaction_id: str) -> Optional[bytes]:
         """Generate QR code for payment."""
@@ -273,49 +278,52 @@ class PaymentProcessor:
         simulate_success: bool = True
     ) -> Dict:
         """Process a dummy payment (for testing/demo)."""
-        transaction = self.transactions.get(transaction_id)
-        if not transaction:
-            return {"success": False, "error": "Transaction not found"}
-        
-        if transaction.status != "pending":
-            return {"success": False, "error": f"Transaction already {transaction.status}"}
-        
-        # Simulate processing
-        transaction.status = "processing"
-        transaction.payment_method = payment_method
-        transaction.updated_at = datetime.now().isoformat()
-        
-        # Simulate payment result
-        if simulate_success:
-            transaction.status = "completed"
-            transaction.confirmation_code = f"PAY_{transaction.transaction_id[:8].upper()}"
+        with self._lock:
+            transaction = self.transactions.get(transaction_id)
+            if not transaction:
+                return {"success": False, "error": "Transaction not found"}
             
-            # Update invoice status
-            if transaction.invoice_id in self.invoices:
-                self.invoices[transaction.invoice_id]["status"] = "paid"
-                self.invoices[transaction.invoice_id]["paid_at"] = datetime.now().isoformat()
-                self.invoices[transaction.invoice_id]["payment_method"] = payment_method
+            if transaction.status != "pending":
+                return {"success": False, "error": f"Transaction already {transaction.status}"}
             
-            result = {
-                "success": True,
-                "status": "completed",
-                "confirmation_code": transaction.confirmation_code,
-                "message": f"Payment of {transaction.currency}{transaction.amount:.2f} completed successfully"
-            }
-        else:
-            transaction.status = "failed"
-            result = {
-                "success": False,
-                "status": "failed",
-                "error": "Payment processing failed",
-                "message": "Please try again or use a different payment method"
-            }
-        
-        transaction.updated_at = datetime.now().isoformat()
-        self.save_data()
-        
-        logger.info(f"Processed payment for transaction {transaction_id}: {result}")
-        return result
+            # one timestamp for every field this payment touches
+            now = datetime.now().isoformat()
+            
+            # Simulate processing
+            transaction.status = "processing"
+            transaction.payment_method = payment_method
+            
+            # Simulate payment result
+            if simulate_success:
+                transaction.status = "completed"
+                transaction.confirmation_code = f"PAY_{transaction.transaction_id[:8].upper()}"
+                
+                # Update invoice status
+                if transaction.invoice_id in self.invoices:
+                    self.invoices[transaction.invoice_id]["status"] = "paid"
+                    self.invoices[transaction.invoice_id]["paid_at"] = now
+                    self.invoices[transaction.invoice_id]["payment_method"] = payment_method
+                
+                result = {
+                    "success": True,
+                    "status": "completed",
+                    "confirmation_code": transaction.confirmation_code,
+                    "message": f"Payment of {transaction.currency}{transaction.amount:.2f} completed successfully"
+                }
+            else:
+                transaction.status = "failed"
+                result = {
+                    "success": False,
+                    "status": "failed",
+                    "error": "Payment processing failed",
+                    "message": "Please try again or use a different payment method"
+                }
+            
+            transaction.updated_at = now
+            self.save_data()
+            
+            logger.info(f"Processed payment for transaction {transaction_id}: {result}")
+            return result
     
     def get_transaction_status(self, transaction_id: str) -> Optional[Dict]:
         """Get transaction status."""
@@ -337,44 +345,46 @@ class PaymentProcessor:
     
     def get_invoice_payments(self, invoice_id: str) -> List[Dict]:
         """Get all payment transactions for an invoice."""
-        return [
-            transaction.to_dict()
-            for transaction in self.transactions.values()
-            if transaction.invoice_id == invoice_id
-        ]
+        with self._lock:
+            return [
+                transaction.to_dict()
+                for transaction in self.transactions.values()
+                if transaction.invoice_id == invoice_id
+            ]
     
     def refund_payment(self, transaction_id: str, reason: str = "Customer request") -> Dict:
         """Process a refund (dummy implementation)."""
-        transaction = self.transactions.get(transaction_id)
-        if not transaction:
-            return {"success": False, "error": "Transaction not found"}
-        
-        if transaction.status != "completed":
-            return {"success": False, "error": "Only completed payments can be refunded"}
-        
-        # Process refund
-        transaction.status = "refunded"
-        transaction.updated_at = datetime.now().isoformat()
-        
-        # Update invoice status
-        if transaction.invoice_id in self.invoices:
-            self.invoices[transaction.invoice_id]["status"] = "refunded"
-            self.invoices[transaction.invoice_id]["refunded_at"] = datetime.now().isoformat()
-            self.invoices[transaction.invoice_id]["refund_reason"] = reason
-        
-        self.save_data()
-        
-        result = {
-            "success": True,
-            "status": "refunded",
-            "refund_amount": transaction.amount,
-            "currency": transaction.currency,
-            "reason": reason,
-            "message": f"Refund of {transaction.currency}{transaction.amount:.2f} processed successfully"
-        }
-        
-        logger.info(f"Processed refund for transaction {transaction_id}: {result}")
-        return result
+        with self._lock:
+            transaction = self.transactions.get(transaction_id)
+            if not transaction:
+                return {"success": False, "error": "Transaction not found"}
+            
+            if transaction.status != "completed":
+                return {"success": False, "error": "Only completed payments can be refunded"}
+            
+            # Process refund
+            transaction.status = "refunded"
+            transaction.updated_at = datetime.now().isoformat()
+            
+            # Update invoice status
+            if transaction.invoice_id in self.invoices:
+                self.invoices[transaction.invoice_id]["status"] = "refunded"
+                self.invoices[transaction.invoice_id]["refunded_at"] = datetime.now().isoformat()
+                self.invoices[transaction.invoice_id]["refund_reason"] = reason
+            
+            self.save_data()
+            
+            result = {
+                "success": True,
+                "status": "refunded",
+                "refund_amount": transaction.amount,
+                "currency": transaction.currency,
+                "reason": reason,
+                "message": f"Refund of {transaction.currency}{transaction.amount:.2f} processed successfully"
+            }
+            
+            logger.info(f"Processed refund for transaction {transaction_id}: {result}")
+            return result
     
     def get_payment_analytics(self, days: int = 30) -> Dict:
         """Get payment analytics for the specified period."""
@@ -389,7 +399,11 @@ class PaymentProcessor:
         payment_methods = {}
         daily_amounts = {}
         
-        for transaction in self.transactions.values():
+        # snapshot so a concurrent payment link can't resize the dict mid-iteration
+        with self._lock:
+            transactions = list(self.transactions.values())
+        
+        for transaction in transactions:
             transaction_date = datetime.fromisoformat(transaction.created_at)
             if transaction_date < cutoff_date:
                 continue
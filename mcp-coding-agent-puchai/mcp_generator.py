@@ -7,23 +7,27 @@ ai-powered invoice pdf generator for puch ai. generates professional invoice pdf
 import asyncio
 import logging
 import os
-import json
-import traceback
-from datetime import datetime, timedelta
-from typing import Annotated, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Annotated
 from pathlib import Path
 
+import orjson
 from dotenv import dotenv_values
 from fastmcp import FastMCP
 from mcp import ErrorData, McpError
 from mcp.types import INTERNAL_ERROR, TextContent
-from pydantic import Field
+from pydantic import Field, ValidationError
 
-from core.invoice_generator import InvoiceGenerator
+from core.invoice_generator import ITEMS_ADAPTER, InvoiceGenerator, InvoiceItem, InvoiceRequest, shutdown_pdf_pool
 from core.payment_processor import PaymentProcessor
-from utils.pdf_creator import create_invoice_pdf
+from utils.pdf_creator import create_invoice_pdf, get_pdf_download_stats
+from utils.zip_creator import get_download_stats
 from utils.download_manager import DownloadManager
+from utils.download_store import DOWNLOAD_BASE_URL, DOWNLOADS_DIR
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, Response
 
 # configure logging
 logging.basicConfig(
@@ -32,19 +36,25 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# the format never shows thread/process fields, so skip collecting them per record
+logging.logThreads = False
+logging.logProcesses = False
+
 logger = logging.getLogger(__name__)
 
 # load env vars (local .env and render)
 env_vars = dotenv_values(".env")
 
+# one merged view: non-empty .env values win, system env (render) fills the rest
+_ENV = {**os.environ, **{key: value for key, value in env_vars.items() if value}}
+
 def get_env_var(key: str, default: str = None) -> str:
     """get env var from .env or system (render fallback)."""
-    return env_vars.get(key) or os.environ.get(key, default)
+    return _ENV.get(key, default)
 
 # required env vars (try .env first, then system env)
 MY_NUMBER = get_env_var("MY_NUMBER")
 AUTH_TOKEN = get_env_var("AUTH_TOKEN")
-DOWNLOAD_BASE_URL = get_env_var("DOWNLOAD_BASE_URL", "http://localhost:8086")
 
 # Validate required environment variables
 required_vars = {
@@ -55,7 +65,7 @@ required_vars = {
 missing_required = [name for name, value in required_vars.items() if not value]
 
 if missing_required:
-    logger.error(f"Missing required environment variables: {missing_required}")
+    logger.error("Missing required environment variables: %s", missing_required)
     raise ValueError(f"Required environment variables not set: {missing_required}")
 
 # init components
@@ -64,16 +74,247 @@ invoice_generator = InvoiceGenerator()
 download_manager = DownloadManager()
 payment_processor = PaymentProcessor(base_url=DOWNLOAD_BASE_URL)
 
+DATA_DIR = Path("data")
+
+# config-derived status fields don't change while the process runs; the download
+# manager and payment processor have created their directories by this point
+_STATUS_SNAPSHOT = {
+    "phone_state": "Configured" if MY_NUMBER else "Missing MY_NUMBER",
+    "auth_state": "Configured" if AUTH_TOKEN else "Missing AUTH_TOKEN",
+    "downloads_state": "Available" if DOWNLOADS_DIR.exists() else "Not Found",
+    "data_state": "Available" if DATA_DIR.exists() else "Not Found"
+}
+
+# deeper accept queue for download bursts, and keep idle connections open long enough
+# for a client to fetch the link it was just handed (asyncio already sets TCP_NODELAY)
+UVICORN_CONFIG = {"backlog": 2048, "timeout_keep_alive": 30}
+
+# threads behind asyncio.to_thread (pdf and record writes, download lookups, payment ledger);
+# the stdlib default of cpu_count + 4 is small on shared render instances
+DL_THREADS = int(get_env_var("DL_THREADS", "32"))
+
+
+def install_thread_pool() -> None:
+    """size the running loop's default executor for blocking offloads."""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DL_THREADS, thread_name_prefix="io")
+    )
+
 
 @mcp.tool
-async def validate() -> str:
+def validate() -> str:
     """return phone number for puch ai validation."""
-    if not MY_NUMBER:
+    # import fails when MY_NUMBER is missing, so it is always set here
+    return MY_NUMBER
+
+
+def _new_generation_id() -> str:
+    """wall-clock nanoseconds in hex: unique per call and safe across restarts."""
+    # monotonic_ns restarts at boot, and ids are persisted in the payment ledger
+    return f"inv_{time.time_ns():x}"
+
+
+# cap in-flight pdf renders across all tool calls; each holds a whole pdf in memory,
+# so bursts queue here instead of piling onto the process pool
+MAX_CONCURRENT_PDF = int(get_env_var("MAX_CONCURRENT_PDF", "4"))
+_PDF_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_PDF)
+
+# most invoices one generate_invoices_batch call may render
+MAX_BATCH_INVOICES = int(get_env_var("MAX_BATCH_INVOICES", "20"))
+
+
+_ITEMS_FORMAT_HINT = "Expected format: [{\"name\": \"Item 1\", \"quantity\": 2, \"rate\": 100.00}]"
+
+
+def _describe_item_error(error: dict) -> str:
+    """map a pydantic validation error onto the tool's item error messages."""
+    loc = error["loc"]
+    if error["type"] == "json_invalid":
+        return f"Invalid JSON format for items. {_ITEMS_FORMAT_HINT}"
+    if not loc:
+        return f"Items must be a list. {_ITEMS_FORMAT_HINT}"
+    if len(loc) == 1:
+        return f"Item {loc[0] + 1} must be an object with name, quantity, and rate"
+    if error["type"] == "missing":
+        return f"Item {loc[0] + 1} missing required field: {loc[1]}"
+    if error["type"] == "greater_than":
+        return f"Item {loc[0] + 1} quantity and rate must be greater than 0"
+    return f"Item {loc[0] + 1} {loc[1]}: {error['msg']}"
+
+
+def _parse_items(items) -> list[InvoiceItem]:
+    """parse and validate an items payload (json string or decoded list) in one pass."""
+    try:
+        if isinstance(items, str):
+            return ITEMS_ADAPTER.validate_json(items)
+        return ITEMS_ADAPTER.validate_python(items)
+    except ValidationError as e:
+        # pydantic checks every item in one pass, so report every problem at once
+        messages = dict.fromkeys(_describe_item_error(error) for error in e.errors())
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
-            message="MY_NUMBER not configured"
+            message="; ".join(messages)
         ))
-    return MY_NUMBER
+
+
+def _validate_date(date: str) -> None:
+    """check a YYYY-MM-DD date without going through strptime."""
+    try:
+        # pin the shape first: fromisoformat also takes YYYYMMDD and week dates
+        if not (len(date) == 10 and date[4] == "-" and date[7] == "-" and date.isascii()):
+            raise ValueError(date)
+        # C-level parse that also rejects impossible days like 2024-02-30
+        datetime.fromisoformat(date)
+    except ValueError:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message="Date must be in YYYY-MM-DD format"
+        ))
+
+
+# messages for the request-level checks, keyed by field
+_REQUEST_FIELD_ERRORS = {
+    "buyer_name": "Buyer name cannot be empty",
+    "company_name": "Company name cannot be empty",
+    "items": "At least one item is required"
+}
+
+
+def _build_invoice_request(
+    buyer_name: str,
+    company_name: str,
+    items,
+    date: str,
+    tax_rate: float = 0.0,
+    currency_symbol: str = "₹"
+) -> InvoiceRequest:
+    """validate every invoice parameter and return the request model."""
+    items_list = _parse_items(items)
+    try:
+        request = InvoiceRequest(
+            buyer_name=buyer_name,
+            company_name=company_name,
+            items=items_list,
+            date=date,
+            tax_rate=tax_rate,
+            currency_symbol=currency_symbol
+        )
+    except ValidationError as e:
+        error = e.errors()[0]
+        field = error["loc"][0]
+        message = None
+        if error["type"] in ("string_pattern_mismatch", "too_short"):
+            message = _REQUEST_FIELD_ERRORS.get(field)
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=message or f"Invalid {field}: {error['msg']}"
+        ))
+    
+    _validate_date(request.date)
+    return request
+
+
+async def _store_invoice(request: InvoiceRequest, generation_id: str, pdf_data: bytes, amount: float) -> str:
+    """save a rendered invoice pdf and return its download url."""
+    logger.info("[%s] Progress: Creating downloadable PDF package...", generation_id)
+    
+    logger.info("[MCP_TOOL] About to call create_invoice_pdf with %s bytes", len(pdf_data))
+    logger.debug("[MCP_TOOL] PDF creation args: buyer=%s, company=%s, amount=%s", request.buyer_name, request.company_name, amount)
+    
+    # save pdf and get download url
+    return await create_invoice_pdf(
+        pdf_data=pdf_data,
+        buyer_name=request.buyer_name,
+        company_name=request.company_name,
+        amount=amount,
+        date=request.date,
+        generation_id=generation_id
+    )
+
+
+async def _render_and_store_invoice(request: InvoiceRequest, generation_id: str) -> str:
+    """render a validated multi-item invoice and return its download url."""
+    logger.info("[%s] Progress: Generating professional multi-item invoice PDF...", generation_id)
+    
+    # generate invoice pdf with multiple items
+    async with _PDF_SEMAPHORE:
+        pdf_data = await invoice_generator.generate_multi_item_invoice_pdf(
+            items=request.items,
+            buyer_name=request.buyer_name,
+            company_name=request.company_name,
+            date=request.date,
+            generation_id=generation_id,
+            tax_rate=request.tax_rate,
+            currency_symbol=request.currency_symbol
+        )
+    
+    return await _store_invoice(request, generation_id, pdf_data, request.subtotal)
+
+
+# response templates, formatted with str.format per call
+_INVOICE_SUCCESS_TEMPLATE = """✅ **Bill Generated Successfully!**
+
+📋 **Details:**
+• Company: {company_name}
+• Buyer: {buyer_name} 
+• Items: {item_count} items
+• Total: {currency_symbol}{total}
+• Date: {date}
+
+📎 **Download Link:** {download_url}
+⏰ **Expires:** 24 hours
+⚡ **Generated in:** {generation_time:.1f}s
+
+Your professional Bill PDF is ready for download!"""
+
+_PAYMENT_INVOICE_TEMPLATE = """✅ **Payment-Enabled Invoice Generated Successfully!**
+
+📋 **Invoice Details:**
+• Company: {company_name}
+• Buyer: {buyer_name}
+• Items: {item_count} items
+• Total: {currency_symbol}{total}
+• Date: {date}
+
+📎 **Download Link:** {download_url}
+⏰ **Expires:** 24 hours
+⚡ **Generated in:** {generation_time:.1f}s
+
+{payment_section}
+
+{features_section}
+
+Your payment-enabled invoice PDF is ready for download!"""
+
+_PAYMENT_LINK_SECTION = """**Payment Integration:**
+🔗 **Payment Link:** {payment_url}
+📱 **QR Code:** Embedded in PDF for mobile payments
+💳 **Payment Methods:** {methods}
+⏰ **Payment Status:** Pending"""
+
+_PAYMENT_LINK_FEATURES = """**Features:**
+- ✅ Payment-enabled PDF with QR codes
+- ✅ Clickable payment buttons
+- ✅ Multiple payment methods
+- ✅ Payment status tracking
+- ✅ Professional invoice design
+
+Customers can now pay instantly by scanning the QR code or clicking the payment link!"""
+
+_MANUAL_PAYMENT_SECTION = """**Payment Integration:**
+⚠️ **Payment Link:** Not available (payment system temporarily unavailable)
+📄 **Invoice PDF:** Contains payment instructions for manual processing
+💳 **Payment Methods:** {methods}
+⏰ **Payment Status:** Pending (Manual processing required)"""
+
+_MANUAL_PAYMENT_FEATURES = """**Features:**
+- ✅ Professional invoice PDF generated
+- ✅ Payment instructions included in PDF
+- ✅ Manual payment processing available
+- ✅ Invoice tracking and management
+- ⚠️ Automatic payment processing temporarily unavailable
+
+Customers can process payment manually using the instructions in the PDF."""
 
 
 @mcp.tool(description="Generate a professional BILL PDF")
@@ -86,169 +327,171 @@ async def generate_invoice(
     currency_symbol: Annotated[str, Field(description="Currency symbol")] = "₹"
 ) -> list[TextContent]:
     """generate a professional invoice pdf with multiple items."""
-    start_time = datetime.now()
-    generation_id = f"inv_{int(start_time.timestamp())}"
+    start_ns = time.perf_counter_ns()
+    generation_id = _new_generation_id()
     
-    logger.info(f"[MCP_TOOL] generate_invoice called via MCP")
-    logger.info(f"[MCP_TOOL] Parameters: buyer={buyer_name}, company={company_name}")
-    logger.info(f"[MCP_TOOL] Items JSON: {items}")
-    logger.info(f"[MCP_TOOL] Generation ID: {generation_id}")
+    logger.info("[MCP_TOOL] generate_invoice called via MCP")
+    logger.info("[MCP_TOOL] Parameters: buyer=%s, company=%s", buyer_name, company_name)
+    logger.info("[MCP_TOOL] Items JSON: %s", items)
+    logger.info("[MCP_TOOL] Generation ID: %s", generation_id)
     
     # use current date if not provided
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d")
     
-    logger.debug(f"[MCP_TOOL] Using date: {date}, tax_rate: {tax_rate}, currency: {currency_symbol}")
-    
-    # progress logging
-    def log_progress(message: str):
-        """Log progress updates with timestamps."""
-        logger.info(f"[{generation_id}] Progress: {message}")
+    logger.debug("[MCP_TOOL] Using date: %s, tax_rate: %s, currency: %s", date, tax_rate, currency_symbol)
     
     try:
-        logger.info(f"[{generation_id}] Starting multi-item invoice generation for: {buyer_name}")
+        logger.info("[%s] Starting multi-item invoice generation for: %s", generation_id, buyer_name)
         
-        # Parse items JSON
-        try:
-            items_list = json.loads(items)
-        except json.JSONDecodeError:
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message="Invalid JSON format for items. Expected format: [{\"name\": \"Item 1\", \"quantity\": 2, \"rate\": 100.00}]"
-            ))
+        # validate inputs (items are parsed and validated in the same pass)
+        request = _build_invoice_request(buyer_name, company_name, items, date, tax_rate, currency_symbol)
+        total_amount = request.subtotal
+        
+        download_url = await _render_and_store_invoice(request, generation_id)
+        
+        logger.info("[MCP_TOOL] create_invoice_pdf returned: %s", download_url)
+        
+        # track generation metrics
+        generation_time = (time.perf_counter_ns() - start_ns) / 1e9
+        logger.info("[%s] Progress: Multi-item invoice PDF generated successfully in %.1fs", generation_id, generation_time)
         
-        # validate inputs
-        if not buyer_name.strip():
+        # format response
+        subtotal = total_amount
+        tax_amount = subtotal * tax_rate
+        final_total = subtotal + tax_amount
+        # formatted once and reused by the log line and the response
+        total_display = f"{final_total:,.2f}"
+        
+        logger.info("[MCP_TOOL] Preparing success response with download URL: %s (total %s%s)", download_url, currency_symbol, total_display)
+        
+        success_message = _INVOICE_SUCCESS_TEMPLATE.format(
+            company_name=company_name,
+            buyer_name=buyer_name,
+            item_count=len(request.items),
+            currency_symbol=currency_symbol,
+            total=total_display,
+            date=date,
+            download_url=download_url,
+            generation_time=generation_time
+        )
+        
+        logger.info("[MCP_TOOL] Returning success response with %s characters", len(success_message))
+        
+        logger.info("[MCP_TOOL] Successfully generated invoice, returning TextContent")
+        return [TextContent.model_construct(type="text", text=success_message)]
+        
+    except Exception as e:
+        logger.error("[MCP_TOOL] [%s] Generation failed: %s", generation_id, e)
+        logger.error("[MCP_TOOL] Full exception:", exc_info=True)
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"Invoice generation failed: {str(e)}"
+        ))
+
+
+
+
+@mcp.tool(description="Generate multiple BILL PDFs in one call")
+async def generate_invoices_batch(
+    invoices: Annotated[str, Field(description="JSON string of invoices: [{\"buyer_name\": \"Client A\", \"company_name\": \"My Co\", \"items\": [{\"name\": \"Item 1\", \"quantity\": 2, \"rate\": 100.00}], \"date\": \"2024-01-15\", \"tax_rate\": 0.18, \"currency_symbol\": \"₹\"}]")]
+) -> list[TextContent]:
+    """generate several invoice pdfs concurrently, validating every invoice before rendering any."""
+    start_ns = time.perf_counter_ns()
+    batch_id = _new_generation_id()
+    
+    logger.info("[MCP_TOOL] generate_invoices_batch called via MCP")
+    
+    try:
+        try:
+            specs = orjson.loads(invoices)
+        except orjson.JSONDecodeError:
             raise McpError(ErrorData(
                 code=INTERNAL_ERROR,
-                message="Buyer name cannot be empty"
+                message="Invalid JSON format for invoices. Expected a list of invoice objects"
             ))
         
-        if not company_name.strip():
+        if not isinstance(specs, list) or not specs:
             raise McpError(ErrorData(
                 code=INTERNAL_ERROR,
-                message="Company name cannot be empty"
+                message="At least one invoice is required"
             ))
         
-        if not items_list or len(items_list) == 0:
+        if len(specs) > MAX_BATCH_INVOICES:
             raise McpError(ErrorData(
                 code=INTERNAL_ERROR,
-                message="At least one item is required"
+                message=f"At most {MAX_BATCH_INVOICES} invoices can be generated per batch, got {len(specs)}"
             ))
         
-        # validate each item
-        total_amount = 0
-        for i, item in enumerate(items_list):
-            if not isinstance(item, dict):
+        # validate every invoice upfront so a bad entry fails the batch before any rendering
+        jobs = []
+        today = datetime.now().strftime("%Y-%m-%d")
+        for n, spec in enumerate(specs, start=1):
+            if not isinstance(spec, dict):
                 raise McpError(ErrorData(
                     code=INTERNAL_ERROR,
-                    message=f"Item {i+1} must be an object with name, quantity, and rate"
+                    message=f"Invoice {n} must be an object with buyer_name, company_name, and items"
                 ))
             
-            required_fields = ['name', 'quantity', 'rate']
-            for field in required_fields:
-                if field not in item:
-                    raise McpError(ErrorData(
-                        code=INTERNAL_ERROR,
-                        message=f"Item {i+1} missing required field: {field}"
-                    ))
-            
-            if item['quantity'] <= 0 or item['rate'] <= 0:
+            try:
+                request = _build_invoice_request(
+                    buyer_name=spec.get("buyer_name") or "",
+                    company_name=spec.get("company_name") or "",
+                    items=spec.get("items") or [],
+                    date=spec.get("date") or today,
+                    tax_rate=spec.get("tax_rate", 0.0),
+                    currency_symbol=spec.get("currency_symbol", "₹")
+                )
+            except McpError as e:
                 raise McpError(ErrorData(
                     code=INTERNAL_ERROR,
-                    message=f"Item {i+1} quantity and rate must be greater than 0"
+                    message=f"Invoice {n}: {e.error.message}"
                 ))
-            
-            total_amount += item['quantity'] * item['rate']
-        
-        # validate date format
-        try:
-            datetime.strptime(date, "%Y-%m-%d")
-        except ValueError:
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message="Date must be in YYYY-MM-DD format"
-            ))
+            # suffix keeps invoice numbers unique within the batch
+            jobs.append((request, f"{batch_id}{n:03x}"))
         
-        log_progress("Generating professional multi-item invoice PDF...")
+        logger.info("[MCP_TOOL] Rendering %s invoices (concurrency %s)", len(jobs), MAX_CONCURRENT_PDF)
         
-        # generate invoice pdf with multiple items
-        pdf_data = await invoice_generator.generate_multi_item_invoice_pdf(
-            items=items_list,
-            buyer_name=buyer_name,
-            company_name=company_name,
-            date=date,
-            generation_id=generation_id,
-            tax_rate=tax_rate,
-            currency_symbol=currency_symbol
-        )
-        
-        log_progress("Creating downloadable PDF package...")
-        
-        logger.info(f"[MCP_TOOL] About to call create_invoice_pdf with {len(pdf_data)} bytes")
-        logger.debug(f"[MCP_TOOL] PDF creation args: buyer={buyer_name}, company={company_name}, amount={total_amount}")
-        
-        # save pdf and get download url
-        download_url = await create_invoice_pdf(
-            pdf_data=pdf_data,
-            buyer_name=buyer_name,
-            company_name=company_name,
-            amount=total_amount,
-            date=date,
-            generation_id=generation_id
-        )
-        
-        logger.info(f"[MCP_TOOL] create_invoice_pdf returned: {download_url}")
-        
-        # track generation metrics
-        generation_time = (datetime.now() - start_time).total_seconds()
-        log_progress(f"Multi-item invoice PDF generated successfully in {generation_time:.1f}s")
-        
-        # format response
-        tax_display = f"Tax Rate: {tax_rate*100:.0f}%" if tax_rate > 0 else "Tax Rate: 0% (No tax)"
-        items_display = "\n".join([f"- {item['name']}: {item['quantity']} x {currency_symbol}{item['rate']:.2f}" for item in items_list])
+        # renders are bounded by _PDF_SEMAPHORE inside the helper; the task group cancels the
+        # remaining renders as soon as one fails, so a failed batch stops storing pdfs
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(_render_and_store_invoice(*job)) for job in jobs]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0]
+        download_urls = [task.result() for task in tasks]
         
-        subtotal = total_amount
-        tax_amount = subtotal * tax_rate
-        final_total = subtotal + tax_amount
+        generation_time = (time.perf_counter_ns() - start_ns) / 1e9
+        logger.info("[MCP_TOOL] Batch of %s invoices generated in %.1fs", len(jobs), generation_time)
         
-        logger.info(f"[MCP_TOOL] Preparing success response with download URL: {download_url}")
+        lines = []
+        for n, ((request, _), url) in enumerate(zip(jobs, download_urls), start=1):
+            final_total = request.subtotal * (1 + request.tax_rate)
+            lines.append(f"{n}. {request.buyer_name} - {request.currency_symbol}{final_total:,.2f}\n   📎 {url}")
         
-        success_message = f"""✅ **Bill Generated Successfully!**
+        invoice_lines = "\n".join(lines)
+        summary = f"""✅ **{len(jobs)} Bills Generated Successfully!**
 
-📋 **Details:**
-• Company: {company_name}
-• Buyer: {buyer_name} 
-• Items: {len(items_list)} items
-• Total: {currency_symbol}{final_total:,.2f}
-• Date: {date}
+{invoice_lines}
 
-📎 **Download Link:** {download_url}
 ⏰ **Expires:** 24 hours
-⚡ **Generated in:** {generation_time:.1f}s
-
-Your professional Bill PDF is ready for download!"""
-        
-        logger.info(f"[MCP_TOOL] Returning success response with {len(success_message)} characters")
+⚡ **Generated in:** {generation_time:.1f}s"""
         
-        logger.info(f"[MCP_TOOL] Successfully generated invoice, returning TextContent")
-        return [TextContent(type="text", text=success_message)]
+        return [TextContent.model_construct(type="text", text=summary)]
         
     except Exception as e:
-        logger.error(f"[MCP_TOOL] [{generation_id}] Generation failed: {str(e)}")
-        logger.error(f"[MCP_TOOL] Full exception: {traceback.format_exc()}")
+        logger.error("[MCP_TOOL] Batch generation failed: %s", e)
+        logger.error("[MCP_TOOL] Full exception:", exc_info=True)
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
-            message=f"Invoice generation failed: {str(e)}"
+            message=f"Batch invoice generation failed: {str(e)}"
         ))
 
 
 
 
-@mcp.tool(description="Get examples of invoice formats")
-async def get_invoice_examples() -> list[TextContent]:
-    """return examples of invoice generation."""
-    examples = """**Invoice Generation Examples**
+# the examples never change, so the response is built once at import
+_EXAMPLES_TEXT = """**Invoice Generation Examples**
 
 **Multi-Item Invoice:**
 Use `generate_invoice` for multiple items in a single invoice:
@@ -303,8 +546,14 @@ Use `generate_invoice` for multiple items in a single invoice:
 
 **Ready to generate your customized professional invoice!**
 """
-    
-    return [TextContent(type="text", text=examples)]
+
+_EXAMPLES_RESPONSE = [TextContent.model_construct(type="text", text=_EXAMPLES_TEXT)]
+
+
+@mcp.tool(description="Get examples of invoice formats")
+def get_invoice_examples() -> list[TextContent]:
+    """return examples of invoice generation."""
+    return _EXAMPLES_RESPONSE
 
 
 @mcp.tool(description="Generate invoice with payment integration (QR codes and payment links)")
@@ -317,41 +566,27 @@ async def generate_invoice_with_payment(
     currency_symbol: Annotated[str, Field(description="Currency symbol")] = "₹"
 ) -> list[TextContent]:
     """Generate an invoice with payment integration."""
-    start_time = datetime.now()
-    generation_id = f"inv_{int(start_time.timestamp())}"
+    start_ns = time.perf_counter_ns()
+    generation_id = _new_generation_id()
     
     # Use current date if not provided
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d")
     
     try:
-        logger.info(f"[{generation_id}] Starting payment-enabled invoice generation")
+        logger.info("[%s] Starting payment-enabled invoice generation", generation_id)
         
-        # Parse and validate items
-        try:
-            items_list = json.loads(items)
-        except json.JSONDecodeError as e:
-            logger.error(f"[{generation_id}] JSON parsing failed: {e}")
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"Invalid JSON format for items: {str(e)}"
-            ))
+        # Parse and validate inputs (shared with generate_invoice)
+        request = _build_invoice_request(buyer_name, company_name, items, date, tax_rate, currency_symbol)
         
-        # Basic validation
-        if not items_list:
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message="Items list cannot be empty"
-            ))
-        
-        logger.info(f"[{generation_id}] Validating {len(items_list)} items")
+        logger.info("[%s] Validated %s items", generation_id, len(request.items))
         
         # Calculate total amount
-        total_amount = sum(item['quantity'] * item['rate'] for item in items_list)
+        total_amount = request.subtotal
         tax_amount = total_amount * tax_rate
         final_total = total_amount + tax_amount
         
-        logger.info(f"[{generation_id}] Calculated total: {currency_symbol}{final_total:.2f}")
+        logger.info("[%s] Calculated total: %s%.2f", generation_id, currency_symbol, final_total)
         
         # Create payment link with improved error handling
         payment_info = {
@@ -361,17 +596,11 @@ async def generate_invoice_with_payment(
         }
         
         try:
-            logger.info(f"[{generation_id}] Attempting to create payment link for amount: {currency_symbol}{final_total:.2f}")
-            
-            # Validate payment processor configuration
-            if not payment_processor:
-                raise ValueError("Payment processor not initialized")
-                
-            if not hasattr(payment_processor, 'base_url') or not payment_processor.base_url:
-                raise ValueError("Payment processor base URL not configured")
+            logger.info("[%s] Attempting to create payment link for amount: %s%.2f", generation_id, currency_symbol, final_total)
             
-            # Create payment link
-            payment_result = payment_processor.create_payment_link(
+            # Create payment link (persists the ledger to disk, so keep it off the event loop)
+            payment_result = await asyncio.to_thread(
+                payment_processor.create_payment_link,
                 invoice_id=generation_id,
                 amount=final_total,
                 currency=currency_symbol
@@ -385,103 +614,65 @@ async def generate_invoice_with_payment(
                 "error": None
             }
             
-            logger.info(f"[{generation_id}] Payment link created successfully: {payment_info['payment_url']}")
+            logger.info("[%s] Payment link created successfully: %s", generation_id, payment_info['payment_url'])
             
         except Exception as e:
             error_msg = f"Payment system error: {str(e)}"
-            logger.warning(f"[{generation_id}] {error_msg}")
-            logger.debug(f"[{generation_id}] Payment creation error details: {traceback.format_exc()}")
+            logger.warning("[%s] %s", generation_id, error_msg)
+            logger.debug("[%s] Payment creation error details:", generation_id, exc_info=True)
             
             # Set error info but continue with invoice generation
             payment_info["error"] = error_msg
             # Keep default values for payment_url (empty) and manual payment methods
         
         # Generate invoice with payment integration
-        pdf_data = await invoice_generator.generate_invoice_with_payment(
-            items=items_list,
-            buyer_name=buyer_name,
-            company_name=company_name,
-            date=date,
-            generation_id=generation_id,
-            payment_url=payment_info["payment_url"],
-            tax_rate=tax_rate,
-            currency_symbol=currency_symbol
-        )
+        async with _PDF_SEMAPHORE:
+            pdf_data = await invoice_generator.generate_invoice_with_payment(
+                items=request.items,
+                buyer_name=request.buyer_name,
+                company_name=request.company_name,
+                date=request.date,
+                generation_id=generation_id,
+                payment_url=payment_info["payment_url"],
+                tax_rate=request.tax_rate,
+                currency_symbol=request.currency_symbol
+            )
         
         # Save PDF and get download URL
-        download_url = await create_invoice_pdf(
-            pdf_data=pdf_data,
-            buyer_name=buyer_name,
-            company_name=company_name,
-            amount=final_total,
-            date=date,
-            generation_id=generation_id
-        )
-        
+        download_url = await _store_invoice(request, generation_id, pdf_data, final_total)
         
         # Generation time
-        generation_time = (datetime.now() - start_time).total_seconds()
+        generation_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         # Format response
-        items_display = "\n".join([f"- {item['name']}: {item['quantity']} x {currency_symbol}{item['rate']:.2f}" for item in items_list])
-        
         # Check if payment link was successfully created
         has_payment_link = payment_info["payment_url"] and payment_info["payment_url"].strip()
         
+        methods = ', '.join(payment_info["available_methods"])
         if has_payment_link:
-            payment_section = f"""**Payment Integration:**
-🔗 **Payment Link:** {payment_info["payment_url"]}
-📱 **QR Code:** Embedded in PDF for mobile payments
-💳 **Payment Methods:** {', '.join(payment_info["available_methods"])}
-⏰ **Payment Status:** Pending"""
-            
-            features_section = """**Features:**
-- ✅ Payment-enabled PDF with QR codes
-- ✅ Clickable payment buttons
-- ✅ Multiple payment methods
-- ✅ Payment status tracking
-- ✅ Professional invoice design
-
-Customers can now pay instantly by scanning the QR code or clicking the payment link!"""
+            payment_section = _PAYMENT_LINK_SECTION.format(payment_url=payment_info["payment_url"], methods=methods)
+            features_section = _PAYMENT_LINK_FEATURES
         else:
-            payment_section = f"""**Payment Integration:**
-⚠️ **Payment Link:** Not available (payment system temporarily unavailable)
-📄 **Invoice PDF:** Contains payment instructions for manual processing
-💳 **Payment Methods:** {', '.join(payment_info["available_methods"])}
-⏰ **Payment Status:** Pending (Manual processing required)"""
-            
-            features_section = """**Features:**
-- ✅ Professional invoice PDF generated
-- ✅ Payment instructions included in PDF
-- ✅ Manual payment processing available
-- ✅ Invoice tracking and management
-- ⚠️ Automatic payment processing temporarily unavailable
-
-Customers can process payment manually using the instructions in the PDF."""
+            payment_section = _MANUAL_PAYMENT_SECTION.format(methods=methods)
+            features_section = _MANUAL_PAYMENT_FEATURES
         
-        success_message = f"""✅ **Payment-Enabled Invoice Generated Successfully!**
-
-📋 **Invoice Details:**
-• Company: {company_name}
-• Buyer: {buyer_name}
-• Items: {len(items_list)} items
-• Total: {currency_symbol}{final_total:,.2f}
-• Date: {date}
-
-📎 **Download Link:** {download_url}
-⏰ **Expires:** 24 hours
-⚡ **Generated in:** {generation_time:.1f}s
-
-{payment_section}
-
-{features_section}
-
-Your payment-enabled invoice PDF is ready for download!"""
+        success_message = _PAYMENT_INVOICE_TEMPLATE.format(
+            company_name=company_name,
+            buyer_name=buyer_name,
+            item_count=len(request.items),
+            currency_symbol=currency_symbol,
+            total=f"{final_total:,.2f}",
+            date=date,
+            download_url=download_url,
+            generation_time=generation_time,
+            payment_section=payment_section,
+            features_section=features_section
+        )
         
-        return [TextContent(type="text", text=success_message)]
+        return [TextContent.model_construct(type="text", text=success_message)]
         
     except Exception as e:
-        logger.error(f"[{generation_id}] Payment-enabled invoice generation failed: {str(e)}")
+        logger.error("[%s] Payment-enabled invoice generation failed: %s", generation_id, e)
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
             message=f"Payment-enabled invoice generation failed: {str(e)}"
@@ -496,7 +687,9 @@ async def process_dummy_payment(
 ) -> list[TextContent]:
     """Process a dummy payment for demonstration purposes."""
     try:
-        result = payment_processor.process_dummy_payment(
+        # settling a payment rewrites the ledger files, so keep it off the event loop
+        result = await asyncio.to_thread(
+            payment_processor.process_dummy_payment,
             transaction_id=transaction_id,
             payment_method=payment_method,
             simulate_success=simulate_success
@@ -533,10 +726,10 @@ async def process_dummy_payment(
 
 😔 **Please try again.**"""
         
-        return [TextContent(type="text", text=message)]
+        return [TextContent.model_construct(type="text", text=message)]
         
     except Exception as e:
-        logger.error(f"Failed to process dummy payment: {e}")
+        logger.error("Failed to process dummy payment: %s", e)
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
             message=f"Payment processing failed: {str(e)}"
@@ -552,7 +745,7 @@ async def get_payment_status(
         transaction = payment_processor.get_transaction_status(transaction_id)
         
         if not transaction:
-            return [TextContent(type="text", text=f"Transaction {transaction_id} not found.")]
+            return [TextContent.model_construct(type="text", text=f"Transaction {transaction_id} not found.")]
         
         status_message = f"""**Payment Transaction Status**
 
@@ -575,10 +768,10 @@ async def get_payment_status(
 - ❌ FAILED: Payment failed
 - 🔄 REFUNDED: Payment refunded"""
         
-        return [TextContent(type="text", text=status_message)]
+        return [TextContent.model_construct(type="text", text=status_message)]
         
     except Exception as e:
-        logger.error(f"Failed to get payment status: {e}")
+        logger.error("Failed to get payment status: %s", e)
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
             message=f"Failed to get payment status: {str(e)}"
@@ -587,13 +780,31 @@ async def get_payment_status(
 
 
 
+# payment analytics rescan the whole ledger; dashboards poll them, so reuse a
+# result for a minute per window size
+_ANALYTICS_CACHE_TTL = 60.0
+_analytics_cache: dict = {}
+
+
+async def _payment_analytics(days: int) -> dict:
+    """payment analytics for the last `days` days, recomputed at most once a minute."""
+    now = time.monotonic()
+    cached = _analytics_cache.get(days)
+    if cached is not None and now - cached[0] < _ANALYTICS_CACHE_TTL:
+        return cached[1]
+    # the ledger scan runs in a thread; cache hits never leave the loop
+    analytics = await asyncio.to_thread(payment_processor.get_payment_analytics, days=days)
+    _analytics_cache[days] = (now, analytics)
+    return analytics
+
+
 @mcp.tool(description="Get payment analytics")
 async def get_system_analytics(
     days: Annotated[int, Field(description="Number of days to analyze (default: 30)")] = 30
 ) -> list[TextContent]:
     """Get comprehensive analytics for payment processing."""
     try:
-        payment_analytics = payment_processor.get_payment_analytics(days=days)
+        payment_analytics = await _payment_analytics(days)
         
         analytics_message = f"""**System Analytics Report** 📊
 
@@ -614,34 +825,29 @@ async def get_system_analytics(
 
 📊 **Payment system operating efficiently!**"""
         
-        return [TextContent(type="text", text=analytics_message)]
+        return [TextContent.model_construct(type="text", text=analytics_message)]
         
     except Exception as e:
-        logger.error(f"Failed to get analytics: {e}")
+        logger.error("Failed to get analytics: %s", e)
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
             message=f"Failed to get analytics: {str(e)}"
         ))
 
 
-@mcp.tool(description="Check the status of the Invoice PDF generator system")
-async def system_status() -> list[TextContent]:
-    """Report comprehensive system status and configuration."""
-    try:
-        # Get system stats
-        payment_stats = payment_processor.get_payment_analytics(days=7)  # Last 7 days
-        
-        status_info = f"""**Invoice PDF Generator System Status** 🗺️
+# config fields don't change while the process runs, so they're baked in at import;
+# only the live counters are left as format fields
+_STATUS_TEMPLATE = f"""**Invoice PDF Generator System Status** 🗺️
 
 **Configuration Status:**
-- Phone Number: {'Configured' if MY_NUMBER else 'Missing MY_NUMBER'}
-- Authentication Token: {'Configured' if AUTH_TOKEN else 'Missing AUTH_TOKEN'}
+- Phone Number: {_STATUS_SNAPSHOT['phone_state']}
+- Authentication Token: {_STATUS_SNAPSHOT['auth_state']}
 
 **System Information:**
 - Download Base URL: {DOWNLOAD_BASE_URL}
-- Downloads Directory: {'Available' if Path('static/downloads').exists() else 'Not Found'}
-- Data Directory: {'Available' if Path('data').exists() else 'Not Found'}
-- Active Downloads: {len(list(Path('static/downloads').glob('*.pdf')) if Path('static/downloads').exists() else [])} files
+- Downloads Directory: {_STATUS_SNAPSHOT['downloads_state']}
+- Data Directory: {_STATUS_SNAPSHOT['data_state']}
+- Active Downloads: {{active_downloads}} files
 
 **Service Status:**
 - ✅ Invoice Generator: Running
@@ -650,8 +856,8 @@ async def system_status() -> list[TextContent]:
 - ✅ Payment Processor: Ready
 
 **Recent Activity (7 days):**
-- Payment Transactions: {payment_stats['total_transactions']}
-- Payment Success Rate: {payment_stats['success_rate']}%
+- Payment Transactions: {{total_transactions}}
+- Payment Success Rate: {{success_rate}}%
 
 **Available Tools:**
 - 📎 `generate_invoice` - Basic invoice generation
@@ -668,24 +874,21 @@ async def system_status() -> list[TextContent]:
 - ✨ Professional invoice design
 - ✨ System analytics
 
-**System Health:** {'Excellent' if payment_stats['success_rate'] > 90 else 'Good' if payment_stats['success_rate'] > 80 else 'Needs Attention'} ✅
+**System Health:** {{health}} ✅
 
 🚀 **Invoice system with payment integration ready!**"""
-        
-        return [TextContent(type="text", text=status_info)]
-        
-    except Exception as e:
-        # Fallback to basic status if analytics fail
-        status_info = f"""**Invoice PDF Generator System Status**
+
+# fallback when payment analytics or download counts are unavailable; static, so built once
+_BASIC_STATUS_TEXT = f"""**Invoice PDF Generator System Status**
 
 **Configuration Status:**
-- Phone Number: {'Configured' if MY_NUMBER else 'Missing MY_NUMBER'}
-- Authentication Token: {'Configured' if AUTH_TOKEN else 'Missing AUTH_TOKEN'}
+- Phone Number: {_STATUS_SNAPSHOT['phone_state']}
+- Authentication Token: {_STATUS_SNAPSHOT['auth_state']}
 
 **System Information:**
 - Download Base URL: {DOWNLOAD_BASE_URL}
-- Downloads Directory: {'Available' if Path('static/downloads').exists() else 'Not Found'}
-- Active Downloads: {len(list(Path('static/downloads').glob('*.pdf')) if Path('static/downloads').exists() else [])} files
+- Downloads Directory: {_STATUS_SNAPSHOT['downloads_state']}
+- Active Downloads: Unavailable
 
 **Service Status:**
 - Invoice Generator: Running
@@ -698,92 +901,128 @@ async def system_status() -> list[TextContent]:
 - Enhanced with payment features
 
 **System Health:** Good ✅"""
+
+_BASIC_STATUS_RESPONSE = [TextContent.model_construct(type="text", text=_BASIC_STATUS_TEXT)]
+
+
+@mcp.tool(description="Check the status of the Invoice PDF generator system")
+async def system_status() -> list[TextContent]:
+    """Report comprehensive system status and configuration."""
+    try:
+        # Get system stats
+        payment_stats = await _payment_analytics(7)  # Last 7 days
+        success_rate = payment_stats['success_rate']
+        
+        status_info = _STATUS_TEMPLATE.format(
+            active_downloads=(await asyncio.to_thread(get_pdf_download_stats))['active_pdfs'],
+            total_transactions=payment_stats['total_transactions'],
+            success_rate=success_rate,
+            health='Excellent' if success_rate > 90 else 'Good' if success_rate > 80 else 'Needs Attention'
+        )
         
-        return [TextContent(type="text", text=status_info)]
+        return [TextContent.model_construct(type="text", text=status_info)]
+        
+    except Exception as e:
+        # Fallback to basic status if analytics or the download store fail; the counts
+        # may be what failed, so the fallback doesn't query them again
+        logger.warning("System status falling back to basic report: %s", e)
+        return _BASIC_STATUS_RESPONSE
 
 
 
 
-async def main() -> None:
-    """run the invoice pdf generator server."""
-    print("\n" + "=" * 60)
-    print("INVOICE PDF GENERATOR SERVER")
-    print("=" * 60)
-    
-    # system status
-    if MY_NUMBER:
-        print(f"Phone: {MY_NUMBER}")
-    else:
-        print("Phone: NOT CONFIGURED")
-        
-    if AUTH_TOKEN:
-        print("Auth Token: CONFIGURED")
-    else:
-        print("Auth Token: NOT CONFIGURED")
-    
-    # create downloads directory
-    downloads_dir = Path("static/downloads")
-    downloads_dir.mkdir(parents=True, exist_ok=True)
-    print(f"Downloads directory: {downloads_dir.absolute()}")
-    
-    # add custom routes
-    @mcp.custom_route(methods=["GET"], path="/download/{download_id}")
-    async def download_mcp_endpoint(request):
-        # extract download_id from url path
-        path_parts = request.url.path.split('/')
-        download_id = path_parts[-1]  # Get the last part of the path
-        logger.info(f"[ROUTE] Download request received: {download_id}")
-        logger.debug(f"[ROUTE] Full URL path: {request.url.path}")
-        logger.debug(f"[ROUTE] Request headers: {dict(request.headers)}")
-        try:
-            result = await download_manager.serve_download(download_id)
-            logger.info(f"[ROUTE] Download served successfully: {download_id}")
-            return result
-        except Exception as e:
-            logger.error(f"[ROUTE] Download failed for {download_id}: {str(e)}")
-            logger.error(f"[ROUTE] Exception details: {traceback.format_exc()}")
-            raise
-    
-    @mcp.custom_route(methods=["GET"], path="/health")
-    async def health_check():
-        logger.debug(f"[ROUTE] Health check requested")
-        return {
+# custom http routes
+@mcp.custom_route(methods=["GET"], path="/download/{download_id}")
+async def download_mcp_endpoint(request):
+    # starlette parsed the id while matching the route
+    download_id = request.path_params["download_id"]
+    logger.info("[ROUTE] Download request received: %s", download_id)
+    logger.debug("[ROUTE] Full URL path: %s", request.url.path)
+    logger.debug("[ROUTE] Request headers: %s", dict(request.headers))
+    try:
+        result = await download_manager.serve_download(download_id)
+        logger.info("[ROUTE] Download served successfully: %s", download_id)
+        return result
+    except Exception as e:
+        logger.error("[ROUTE] Download failed for %s: %s", download_id, e)
+        logger.error("[ROUTE] Exception details:", exc_info=True)
+        raise
+
+
+# health/stats pollers hit these often; serve results at most a second old
+_ROUTE_CACHE_TTL = 1.0
+_health_cache = {"at": 0.0, "payload": b""}
+_stats_cache = {"at": 0.0, "stats": None}
+
+
+def _health_payload() -> bytes:
+    """serialized health body, rebuilt at most once per second."""
+    now = time.monotonic()
+    if now - _health_cache["at"] >= _ROUTE_CACHE_TTL:
+        _health_cache["at"] = now
+        _health_cache["payload"] = orjson.dumps({
             "status": "healthy",
             "service": "Invoice PDF Generator",
             "timestamp": datetime.now().isoformat()
+        })
+    return _health_cache["payload"]
+
+
+async def _combined_download_stats() -> dict:
+    """zip + pdf download stats, recomputed at most once per second."""
+    now = time.monotonic()
+    if _stats_cache["stats"] is None or now - _stats_cache["at"] >= _ROUTE_CACHE_TTL:
+        # the zip stats scan the downloads directory; pdf stats are one query on the download store
+        zip_stats = await asyncio.to_thread(get_download_stats)
+        pdf_stats = await asyncio.to_thread(get_pdf_download_stats)
+        
+        _stats_cache["stats"] = {
+            "zip_files": zip_stats,
+            "pdf_files": pdf_stats,
+            "total_files": zip_stats["total_downloads"] + pdf_stats["total_pdfs"],
+            "total_size": zip_stats["total_size"] + pdf_stats["total_size"],
+            "total_active": zip_stats["active_downloads"] + pdf_stats["active_pdfs"]
         }
-    
-    @mcp.custom_route(methods=["GET"], path="/download-stats")
-    async def download_stats():
-        logger.debug(f"[ROUTE] Download stats requested")
-        try:
-            from utils.zip_creator import get_download_stats
-            from utils.pdf_creator import get_pdf_download_stats
-            
-            zip_stats = get_download_stats()
-            pdf_stats = get_pdf_download_stats()
-            
-            stats = {
-                "zip_files": zip_stats,
-                "pdf_files": pdf_stats,
-                "total_files": zip_stats["total_downloads"] + pdf_stats["total_pdfs"],
-                "total_size": zip_stats["total_size"] + pdf_stats["total_size"],
-                "total_active": zip_stats["active_downloads"] + pdf_stats["active_pdfs"]
-            }
-            logger.info(f"[ROUTE] Download stats: {stats['total_files']} files, {stats['total_active']} active")
-            return stats
-        except Exception as e:
-            logger.error(f"[ROUTE] Failed to get download stats: {e}")
-            raise
-    
-    print("=" * 60)
-    print(f"Server: {DOWNLOAD_BASE_URL}")
-    print(f"Downloads: {DOWNLOAD_BASE_URL}/download/")
-    print("=" * 60)
-    
-    # start server
-    await mcp.run_async("streamable-http", host="0.0.0.0", port=8086)
+        _stats_cache["at"] = now
+    return _stats_cache["stats"]
+
+
+@mcp.custom_route(methods=["GET"], path="/health")
+async def health_check(request):
+    logger.debug("[ROUTE] Health check requested")
+    return Response(_health_payload(), media_type="application/json")
 
 
-if __name__ == "__main__":
-    asyncio.run(main())
+@mcp.custom_route(methods=["GET"], path="/download-stats")
+async def download_stats(request):
+    logger.debug("[ROUTE] Download stats requested")
+    try:
+        stats = await _combined_download_stats()
+        logger.info("[ROUTE] Download stats: %s files, %s active", stats['total_files'], stats['total_active'])
+        return ORJSONResponse(stats)
+    except Exception as e:
+        logger.error("[ROUTE] Failed to get download stats: %s", e)
+        raise
+
+
+async def _serve(port: int) -> None:
+    """serve streamable http on the port, stopping the pdf workers on the way out."""
+    install_thread_pool()
+    try:
+        await mcp.run_async("streamable-http", host="0.0.0.0", port=port, uvicorn_config=UVICORN_CONFIG)
+    finally:
+        shutdown_pdf_pool()
+
+
+def run_server(port: int = 8086) -> None:
+    """run the invoice server until it is stopped."""
+    # use uvloop when available (not supported on windows); a loop factory
+    # avoids swapping the global event loop policy
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(_serve(port))
@@ -4,26 +4,74 @@ download manager for mcp code generator
 manages download links, expiration, and cleanup for generated mcp packages.
 """
 
-import json
+import asyncio
+import itertools
 import logging
+import os
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Callable, ClassVar, Optional, Dict
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+
+from .download_store import DOWNLOADS_DIR, build_download_filename, create_filename_slug, download_store
 
 logger = logging.getLogger(__name__)
 
+# when a reverse proxy fronts the app, hand the file copy to it (nginx internal location:
+# location /_protected/ { internal; alias /app/static/downloads/; sendfile on; tcp_nopush on; })
+USE_X_ACCEL = os.environ.get("USE_X_ACCEL") == "1"
+X_ACCEL_PREFIX = "/_protected/"
+
+# record type -> (filename key, default prefix, extension, media type, description)
+_FILE_TYPES = {
+    "invoice_pdf": ("pdf_filename", "invoice_", ".pdf", "application/pdf", "Generated Invoice PDF"),
+    "zip": ("zip_filename", "mcp_", ".zip", "application/zip", "Generated MCP Package"),
+}
+
+# concurrent unlinks during a cleanup sweep
+CLEANUP_CONCURRENCY = 8
+
+# concurrent file checks when listing active downloads
+LIST_CONCURRENCY = 32
+
+
+# caps on files being streamed at once, so bursts can't exhaust descriptors or thrash the disk;
+# big zips get their own smaller pool so they can't starve the many small invoice pdfs
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "350"))
+MAX_CONCURRENT_LARGE_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_LARGE_DOWNLOADS", "16"))
+LARGE_DOWNLOAD_BYTES = 4 * 1024 * 1024
+_DOWNLOAD_SLOTS = asyncio.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+_LARGE_DOWNLOAD_SLOTS = asyncio.BoundedSemaphore(MAX_CONCURRENT_LARGE_DOWNLOADS)
+
+
+class _SlotFileResponse(FileResponse):
+    """file response that gives its download slot back once sending ends, however it ends."""
+    
+    def __init__(self, *args, release: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._release = release
+    
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
 
 class DownloadManager:
     """manages download functionality for generated mcp packages."""
     
+    # shared by every instance; created once at import, below the class
+    downloads_dir: ClassVar[Path] = DOWNLOADS_DIR
+    
     def __init__(self):
         """init download manager."""
-        self.downloads_dir = Path("static/downloads")
-        self.downloads_dir.mkdir(parents=True, exist_ok=True)
+        self._background_tasks: set[asyncio.Task] = set()
+        # records now live in sqlite; fold in any json records left by older builds
+        download_store.migrate_json_records(self.downloads_dir)
     
     def setup_download_endpoints(self, app: FastAPI) -> None:
         """set up download endpoints in the fastapi app."""
@@ -47,210 +95,204 @@ class DownloadManager:
             from .zip_creator import get_download_stats
             return get_download_stats()
     
-    async def serve_download(self, download_id: str) -> FileResponse:
+    async def serve_download(self, download_id: str) -> Response:
         """serve a download file if it exists and hasn't expired."""
         logger.info(f"[DOWNLOAD] Request for ID: {download_id}")
         
-        # check if download record exists
-        record_path = self.downloads_dir / f"{download_id}.json"
-        logger.debug(f"[DOWNLOAD] Looking for record at: {record_path} (exists: {record_path.exists()})")
-        if not record_path.exists():
-            logger.warning(f"[DOWNLOAD] Record not found: {download_id}")
-            # List available downloads for debugging
-            available = list(self.downloads_dir.glob("*.json"))
-            logger.warning(f"[DOWNLOAD] Available download records: {[f.stem for f in available]}")
-            raise HTTPException(status_code=404, detail="Download not found")
-        
-        # load download record
+        # load download record (one indexed lookup, off the event loop)
         try:
-            logger.debug(f"[DOWNLOAD] Reading record file: {record_path}")
-            with open(record_path) as f:
-                record = json.load(f)
-            logger.debug(f"[DOWNLOAD] Record loaded successfully: {record.get('type', 'unknown type')}")
+            record = await asyncio.to_thread(download_store.get_by_id, download_id)
         except Exception as e:
             logger.error(f"[DOWNLOAD] Failed to read record {download_id}: {e}")
             logger.error(f"[DOWNLOAD] Exception details: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail="Download record corrupted")
+            raise HTTPException(status_code=500, detail="Download record unavailable")
+        
+        if record is None:
+            logger.warning(f"[DOWNLOAD] Record not found: {download_id}")
+            raise HTTPException(status_code=404, detail="Download not found")
+        logger.debug("[DOWNLOAD] Record loaded successfully: %s", record.get('type', 'unknown type'))
         
-        # check if download has expired
-        expires_at = datetime.fromisoformat(record["expires_at"])
+        # check if download has expired (string compare; parse only when reporting minutes)
         current_time = datetime.now()
-        logger.debug(f"[DOWNLOAD] Expiration check: current={current_time.isoformat()}, expires={expires_at.isoformat()}")
-        if current_time > expires_at:
+        logger.debug("[DOWNLOAD] Expiration check: current=%s, expires=%s", current_time, record["expires_at"])
+        if current_time.isoformat() > record["expires_at"]:
+            expires_at = datetime.fromisoformat(record["expires_at"])
             logger.warning(f"[DOWNLOAD] Expired: {download_id} (expired {(current_time - expires_at).total_seconds()/60:.1f} minutes ago)")
-            # Clean up expired files
-            self._cleanup_expired_download(download_id, record)
+            # Clean up expired files in the background so the 410 goes out right away
+            self._cleanup_in_background(download_id, record)
             raise HTTPException(status_code=410, detail="Download has expired")
-        else:
-            logger.debug(f"[DOWNLOAD] Valid: expires in {(expires_at - current_time).total_seconds()/60:.1f} minutes")
+        elif logger.isEnabledFor(logging.DEBUG):
+            expires_at = datetime.fromisoformat(record["expires_at"])
+            logger.debug("[DOWNLOAD] Valid: expires in %.1f minutes", (expires_at - current_time).total_seconds() / 60)
         
         # check if file exists (could be ZIP or PDF)
-        file_path = None
-        media_type = "application/octet-stream"
-        content_description = "Generated File"
-        download_filename = None
+        file_path, media_type, content_description = self._resolve_file(record)
+        logger.debug("[DOWNLOAD] File: %s", file_path.name)
         
-        # Handle different file types
-        if record.get("type") == "invoice_pdf":
-            # PDF invoice file
-            pdf_filename = record.get("pdf_filename", f"invoice_{download_id}.pdf")
-            file_path = self.downloads_dir / pdf_filename
-            media_type = "application/pdf"
-            content_description = "Generated Invoice PDF"
-            
-            logger.debug(f"[DOWNLOAD] PDF file: {pdf_filename} (exists: {file_path.exists()})")
-            
-            # generate a descriptive filename for invoice
-            buyer_slug = self._create_filename_slug(record.get("buyer_name", "invoice"))
-            company_slug = self._create_filename_slug(record.get("company_name", "company"))
-            invoice_number = record.get("invoice_number", download_id[:8])
-            download_filename = f"{company_slug}_{buyer_slug}_{invoice_number}.pdf"
-            logger.debug(f"[DOWNLOAD] Generated descriptive filename: {download_filename}")
-        else:
-            # Legacy ZIP file (MCP packages)
-            zip_filename = record.get("zip_filename", f"mcp_{download_id}.zip")
-            file_path = self.downloads_dir / zip_filename
-            media_type = "application/zip"
-            content_description = "Generated MCP Package"
-            
-            logger.debug(f"[DOWNLOAD] ZIP file: {zip_filename} (exists: {file_path.exists()})")
-            
-            # generate a descriptive filename for MCP
-            prompt_slug = self._create_filename_slug(record.get("prompt", "generated-mcp"))
-            download_filename = f"{prompt_slug}_{download_id[:8]}.zip"
-            logger.debug(f"[DOWNLOAD] Generated descriptive filename: {download_filename}")
+        # descriptive filename is stored with the record; older rows fall back to building it
+        download_filename = record.get("download_filename") or build_download_filename(record)
         
-        if not file_path.exists():
+        try:
+            # a single stat serves both the existence check and FileResponse's headers
+            stat_result = await asyncio.to_thread(os.stat, file_path)
+        except FileNotFoundError:
             logger.error(f"[DOWNLOAD] File not found: {file_path}")
             # List all files in downloads directory for debugging
-            all_files = list(self.downloads_dir.glob("*.*"))
-            logger.error(f"[DOWNLOAD] Files in directory: {[f.name for f in all_files]}")
+            if logger.isEnabledFor(logging.DEBUG):
+                with os.scandir(self.downloads_dir) as entries:
+                    names = [e.name for e in itertools.islice(entries, 50)]
+                logger.debug(f"[DOWNLOAD] Files in directory (first 50): {names}")
             raise HTTPException(status_code=404, detail="Download file not found")
         
-        # serve the file
-        file_size = file_path.stat().st_size
+        headers = {
+            "Content-Description": content_description,
+            "X-Generation-ID": record.get("generation_id", "unknown")
+        }
+        if media_type == "application/pdf":
+            # pdf streams are already deflated; no-transform tells proxies not to recompress them
+            headers["Cache-Control"] = "no-transform"
+        
+        if USE_X_ACCEL:
+            # empty body: the proxy sendfile()s the file, so no bytes pass through python
+            logger.info(f"[DOWNLOAD] Redirecting to proxy: {file_path.name} ({stat_result.st_size:,} bytes)")
+            headers["X-Accel-Redirect"] = f"{X_ACCEL_PREFIX}{file_path.name}"
+            headers["Content-Disposition"] = f'attachment; filename="{download_filename}"'
+            return Response(status_code=200, headers=headers, media_type=media_type)
+        
+        # serve the file, holding a slot from the pool for its size class until the body is sent
+        file_size = stat_result.st_size
+        slots = _LARGE_DOWNLOAD_SLOTS if file_size > LARGE_DOWNLOAD_BYTES else _DOWNLOAD_SLOTS
+        await slots.acquire()
         logger.info(f"[DOWNLOAD] Serving file: {file_path.name} ({file_size:,} bytes)")
-        logger.debug(f"[DOWNLOAD] Content type: {media_type}, filename: {download_filename}")
+        logger.debug("[DOWNLOAD] Content type: %s, filename: %s", media_type, download_filename)
         
-        return FileResponse(
+        return _SlotFileResponse(
             path=file_path,
             filename=download_filename,
             media_type=media_type,
-            headers={
-                "Content-Description": content_description,
-                "X-Generation-ID": record.get("generation_id", "unknown")
-            }
+            headers=headers,
+            stat_result=stat_result,
+            release=slots.release
         )
     
+    def _cleanup_in_background(self, download_id: str, record: Dict) -> None:
+        """run an expired-download cleanup in a thread without awaiting it."""
+        task = asyncio.create_task(asyncio.to_thread(self._cleanup_expired_download, download_id, record))
+        # the loop only keeps weak references to tasks, so hold one until it finishes
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
     def _cleanup_expired_download(self, download_id: str, record: Dict) -> None:
         """clean up an expired download."""
         try:
             # remove file (could be ZIP or PDF)
-            if record.get("type") == "invoice_pdf":
-                # PDF invoice file
-                pdf_filename = record.get("pdf_filename", f"invoice_{download_id}.pdf")
-                file_path = self.downloads_dir / pdf_filename
-                if file_path.exists():
-                    file_path.unlink()
-                    logger.debug(f"Removed expired PDF: {pdf_filename}")
-            else:
-                # Legacy ZIP file
-                zip_filename = record.get("zip_filename", f"mcp_{download_id}.zip")
-                zip_path = self.downloads_dir / zip_filename
-                if zip_path.exists():
-                    zip_path.unlink()
-                    logger.debug(f"Removed expired zip: {zip_filename}")
+            file_path = self._record_file_path(record)
+            file_path.unlink(missing_ok=True)
+            logger.debug("Removed expired file: %s", file_path.name)
             
-            # remove record file
-            record_path = self.downloads_dir / f"{download_id}.json"
-            if record_path.exists():
-                record_path.unlink()
-                logger.debug(f"Removed expired record: {download_id}.json")
+            # remove record
+            download_store.delete(download_id)
+            logger.debug("Removed expired record: %s", download_id)
                 
         except Exception as e:
             logger.warning(f"Error cleaning up expired download {download_id}: {e}")
     
     def _create_filename_slug(self, prompt: str) -> str:
         """create a safe filename slug from the user prompt."""
-        # take first 30 characters and clean them up
-        slug = prompt[:30].lower()
-        
-        # replace spaces and special chars with hyphens
-        safe_chars = "abcdefghijklmnopqrstuvwxyz0123456789-"
-        slug = "".join(c if c in safe_chars else "-" for c in slug)
-        
-        # remove consecutive hyphens and trim
-        while "--" in slug:
-            slug = slug.replace("--", "-")
-        slug = slug.strip("-")
-        
-        # ensure not empty
-        if not slug:
-            slug = "generated-mcp"
-        
-        return slug
+        return create_filename_slug(prompt)
     
     def get_download_info(self, download_id: str) -> Optional[Dict]:
         """get info about a download without serving it."""
-        record_path = self.downloads_dir / f"{download_id}.json"
-        if not record_path.exists():
-            return None
-        
         try:
-            with open(record_path) as f:
-                record = json.load(f)
-            
-            # check if expired
-            expires_at = datetime.fromisoformat(record["expires_at"])
-            is_expired = datetime.now() > expires_at
-            
-            # check if file exists (could be ZIP or PDF)
-            if record.get("type") == "invoice_pdf":
-                pdf_filename = record.get("pdf_filename", f"invoice_{download_id}.pdf")
-                file_path = self.downloads_dir / pdf_filename
-            else:
-                zip_filename = record.get("zip_filename", f"mcp_{download_id}.zip")
-                file_path = self.downloads_dir / zip_filename
-            
-            file_exists = file_path.exists()
-            
-            return {
-                "download_id": download_id,
-                "generation_id": record.get("generation_id"),
-                "created_at": record["created_at"],
-                "expires_at": record["expires_at"],
-                "is_expired": is_expired,
-                "file_exists": file_exists,
-                "file_count": record.get("file_count"),
-                "file_size": record.get("zip_size", record.get("pdf_size", 0)),
-                "file_type": record.get("type", "zip"),
-                "prompt": record.get("prompt", "")[:100]  # Truncated
-            }
+            record = download_store.get_by_id(download_id)
+            if record is None:
+                return None
+            return self._download_info(record, datetime.now().isoformat())
             
         except Exception as e:
             logger.error(f"error reading download info {download_id}: {e}")
             return None
     
+    def _download_info(self, record: Dict, now_iso: str) -> Dict:
+        """build the public info dict for a download record."""
+        download_id = record["id"]
+        
+        # check if expired (iso timestamps from datetime.now() order correctly as strings)
+        is_expired = now_iso > record["expires_at"]
+        
+        # check if file exists (could be ZIP or PDF)
+        file_exists = self._record_file_path(record).exists()
+        
+        return {
+            "download_id": download_id,
+            "generation_id": record.get("generation_id"),
+            "created_at": record["created_at"],
+            "expires_at": record["expires_at"],
+            "is_expired": is_expired,
+            "file_exists": file_exists,
+            "file_count": record.get("file_count"),
+            "file_size": record.get("zip_size", record.get("pdf_size", 0)),
+            "file_type": record.get("type", "zip"),
+            "prompt": record.get("prompt", "")[:100]  # Truncated
+        }
+    
+    def _resolve_file(self, record: Dict) -> tuple[Path, str, str]:
+        """path, media type and description for the file a record points at."""
+        # records without a type are legacy zip packages
+        filename_key, prefix, extension, media_type, description = _FILE_TYPES.get(
+            record.get("type"), _FILE_TYPES["zip"]
+        )
+        filename = record.get(filename_key) or f"{prefix}{record['id']}{extension}"
+        return self.downloads_dir / filename, media_type, description
+    
+    def _record_file_path(self, record: Dict) -> Path:
+        """path of the pdf or zip file a record points at."""
+        return self._resolve_file(record)[0]
+    
     async def cleanup_expired_downloads(self, max_age_hours: int = 24) -> int:
         """clean up expired downloads."""
-        from .zip_creator import cleanup_expired_downloads
-        return cleanup_expired_downloads(max_age_hours)
+        cutoff = (datetime.now() - timedelta(hours=max_age_hours)).isoformat()
+        records = await asyncio.to_thread(download_store.list_created_before, cutoff)
+        if not records:
+            return 0
+        
+        logger.info(f"Cleaning up {len(records)} downloads older than {max_age_hours} hours")
+        
+        # unlinks run in parallel threads, bounded so a big sweep can't exhaust the pool
+        slots = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+        
+        async def remove(path: Path) -> None:
+            async with slots:
+                try:
+                    await asyncio.to_thread(os.unlink, path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Error removing expired file {path.name}: {e}")
+        
+        await asyncio.gather(*(remove(self._record_file_path(record)) for record in records))
+        
+        download_ids = [record["id"] for record in records]
+        # one statement removes every swept record
+        await asyncio.to_thread(download_store.delete_many, download_ids)
+        
+        logger.info(f"Cleaned up {len(download_ids)} expired downloads")
+        return len(download_ids)
     
-    def list_active_downloads(self) -> list[Dict]:
+    async def list_active_downloads(self) -> list[Dict]:
         """list all active (non-expired) downloads."""
-        active_downloads = []
+        now_iso = datetime.now().isoformat()
         
-        for record_file in self.downloads_dir.glob("*.json"):
-            download_id = record_file.stem
-            info = self.get_download_info(download_id)
-            
-            if info and not info["is_expired"] and info["file_exists"]:
-                active_downloads.append(info)
+        # the store filters on the expires_at index and returns newest first
+        records = await asyncio.to_thread(download_store.list_active, now_iso)
         
-        # sort by creation time (newest first)
-        active_downloads.sort(
-            key=lambda x: x["created_at"], 
-            reverse=True
-        )
+        # file checks fan out across threads, bounded to keep descriptor use in check
+        slots = asyncio.BoundedSemaphore(LIST_CONCURRENCY)
+        
+        async def load(record: Dict) -> Dict:
+            async with slots:
+                return await asyncio.to_thread(self._download_info, record, now_iso)
         
-        return active_downloads
+        infos = await asyncio.gather(*(load(record) for record in records))
+        # gather keeps input order, so the newest-first ordering survives
+        return [info for info in infos if info["file_exists"]]
@@ -0,0 +1,220 @@
+"""
+download store for mcp code generator
+
+keeps download records in a sqlite database so lookups are a single indexed query
+instead of opening a json file per request.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import orjson
+from dotenv import dotenv_values
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADS_DIR = Path("static/downloads")
+DB_PATH = DOWNLOADS_DIR / "downloads.db"
+
+# public base of every download link, resolved once (prefer .env, fallback system env);
+# a trailing slash is dropped so links don't come out as ...//download/<id>
+DOWNLOAD_BASE_URL = (dotenv_values(".env").get("DOWNLOAD_BASE_URL") or os.environ.get("DOWNLOAD_BASE_URL", "http://localhost:8086")).rstrip("/")
+
+# the one mkdir per process, at import, so the directory exists before anything writes,
+# stats or scans it
+DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
+
+# one column per key the json records used to carry
+_COLUMNS = (
+    "id", "generation_id", "type", "created_at", "expires_at", "prompt", "file_count",
+    "zip_size", "zip_filename", "pdf_size", "pdf_filename", "buyer_name", "company_name",
+    "amount", "date", "invoice_number", "download_filename",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    id TEXT PRIMARY KEY,
+    generation_id TEXT,
+    type TEXT,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    prompt TEXT,
+    file_count INTEGER,
+    zip_size INTEGER,
+    zip_filename TEXT,
+    pdf_size INTEGER,
+    pdf_filename TEXT,
+    buyer_name TEXT,
+    company_name TEXT,
+    amount REAL,
+    date TEXT,
+    invoice_number TEXT,
+    download_filename TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_downloads_expires_at ON downloads (expires_at);
+CREATE INDEX IF NOT EXISTS idx_downloads_created_at ON downloads (created_at);
+CREATE INDEX IF NOT EXISTS idx_downloads_type ON downloads (type);
+"""
+
+_SLUG_SAFE_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789-")
+_HYPHEN_RUN = re.compile(r"-+")
+
+_INSERT = f"INSERT OR REPLACE INTO downloads ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+
+def create_filename_slug(text: str) -> str:
+    """create a safe filename slug from free text."""
+    # take first 30 characters, replace spaces and special chars with hyphens
+    slug = "".join(c if c in _SLUG_SAFE_CHARS else "-" for c in text[:30].lower())
+    
+    # collapse runs of hyphens in one pass, trim, and ensure not empty
+    return _HYPHEN_RUN.sub("-", slug).strip("-") or "generated-mcp"
+
+
+def build_download_filename(record: Dict) -> str:
+    """build the descriptive filename a download is served under."""
+    download_id = record["id"]
+    if record.get("type") == "invoice_pdf":
+        buyer_slug = create_filename_slug(record.get("buyer_name", "invoice"))
+        company_slug = create_filename_slug(record.get("company_name", "company"))
+        invoice_number = record.get("invoice_number", download_id[:8])
+        return f"{company_slug}_{buyer_slug}_{invoice_number}.pdf"
+    
+    prompt_slug = create_filename_slug(record.get("prompt", "generated-mcp"))
+    return f"{prompt_slug}_{download_id[:8]}.zip"
+
+
+class DownloadStore:
+    """sqlite-backed store for download records."""
+
+    def __init__(self, db_path: Path = DB_PATH):
+        """init download store."""
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """get this thread's connection, creating the schema on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        # wal lets readers in other threads proceed while one writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self._ready_lock:
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                # databases created before download_filename existed
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(downloads)")}
+                if "download_filename" not in existing:
+                    conn.execute("ALTER TABLE downloads ADD COLUMN download_filename TEXT")
+                self._ready = True
+
+        self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict:
+        """turn a row back into the record shape the json files had."""
+        return {key: row[key] for key in row.keys() if row[key] is not None}
+
+    def insert(self, record: Dict) -> None:
+        """insert or replace a download record."""
+        # the served filename never changes, so build it once here rather than per download
+        if not record.get("download_filename"):
+            record = {**record, "download_filename": build_download_filename(record)}
+        self._connect().execute(_INSERT, tuple(record.get(column) for column in _COLUMNS))
+
+    def get_by_id(self, download_id: str) -> Optional[Dict]:
+        """get a download record by id."""
+        row = self._connect().execute("SELECT * FROM downloads WHERE id = ?", (download_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def delete(self, download_id: str) -> None:
+        """delete a download record."""
+        self._connect().execute("DELETE FROM downloads WHERE id = ?", (download_id,))
+
+    def delete_many(self, download_ids: List[str]) -> None:
+        """delete several download records in a few statements."""
+        conn = self._connect()
+        # chunked to stay under sqlite's bound-parameter limit
+        for start in range(0, len(download_ids), 500):
+            chunk = download_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM downloads WHERE id IN ({placeholders})", chunk)
+
+    def list_active(self, now_iso: str) -> List[Dict]:
+        """list records that have not expired yet, newest first."""
+        rows = self._connect().execute(
+            "SELECT * FROM downloads WHERE expires_at > ? ORDER BY created_at DESC", (now_iso,)
+        ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def list_created_before(self, cutoff_iso: str, record_type: Optional[str] = None) -> List[Dict]:
+        """list records created before the cutoff, optionally of one type."""
+        if record_type is None:
+            rows = self._connect().execute(
+                "SELECT * FROM downloads WHERE created_at < ?", (cutoff_iso,)
+            ).fetchall()
+        else:
+            rows = self._connect().execute(
+                "SELECT * FROM downloads WHERE created_at < ? AND type = ?", (cutoff_iso, record_type)
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def pdf_stats(self, now_iso: str) -> Dict[str, int]:
+        """count, total size and still-active count of invoice pdf records."""
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(pdf_size), 0), COALESCE(SUM(expires_at > ?), 0) "
+            "FROM downloads WHERE type = 'invoice_pdf'",
+            (now_iso,)
+        ).fetchone()
+        return {"total_pdfs": row[0], "total_size": row[1], "active_pdfs": row[2]}
+
+    def expiry_map(self) -> Dict[str, str]:
+        """map every download id to its expiry timestamp."""
+        rows = self._connect().execute("SELECT id, expires_at FROM downloads").fetchall()
+        return {row["id"]: row["expires_at"] for row in rows}
+
+    def migrate_json_records(self, downloads_dir: Path = DOWNLOADS_DIR) -> int:
+        """import legacy json record files into the store and remove them."""
+        migrated = 0
+        try:
+            entries = os.scandir(downloads_dir)
+        except FileNotFoundError:
+            return 0
+
+        # this runs on every startup, so filter on dirent names and types without a stat per file
+        with entries:
+            json_entries = [
+                entry for entry in entries
+                if entry.name.endswith(".json") and entry.is_file(follow_symlinks=False)
+            ]
+
+        for entry in json_entries:
+            try:
+                with open(entry.path, "rb") as f:
+                    record = orjson.loads(f.read())
+                record.setdefault("id", entry.name[:-5])
+                self.insert(record)
+                os.unlink(entry.path)
+                migrated += 1
+            except Exception as e:
+                logger.warning(f"[DOWNLOAD_STORE] Could not migrate {entry.name}: {e}")
+
+        if migrated:
+            logger.info(f"[DOWNLOAD_STORE] Migrated {migrated} json download records")
+        return migrated
+
+
+download_store = DownloadStore()
@@ -4,8 +4,8 @@ pdf creator for invoice pdf generator
 creates downloadable pdf packages containing generated invoice pdfs.
 """
 
+import asyncio
 import hashlib
-import json
 import logging
 import os
 import time
@@ -13,10 +13,17 @@ import traceback
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict
-from dotenv import dotenv_values
+
+from .download_store import DOWNLOAD_BASE_URL, DOWNLOADS_DIR, download_store
 
 logger = logging.getLogger(__name__)
 
+# how long a download link stays valid
+DOWNLOAD_TTL = timedelta(hours=24)
+
+# invoices are a page or two of text; anything bigger suggests uncompressed streams
+MAX_EXPECTED_PDF_SIZE = 2 * 1024 * 1024
+
 
 async def create_invoice_pdf(
     pdf_data: bytes,
@@ -28,13 +35,13 @@ async def create_invoice_pdf(
 ) -> str:
     """create a downloadable pdf package containing the generated invoice."""
     logger.info(f"[PDF_CREATOR] Starting PDF creation for generation: {generation_id}")
-    logger.debug(f"[PDF_CREATOR] Input - buyer: {buyer_name}, company: {company_name}, amount: {amount}, date: {date}")
-    logger.debug(f"[PDF_CREATOR] PDF data size: {len(pdf_data):,} bytes")
+    logger.debug("[PDF_CREATOR] Input - buyer: %s, company: %s, amount: %s, date: %s", buyer_name, company_name, amount, date)
+    logger.debug("[PDF_CREATOR] PDF data size: %s bytes", len(pdf_data))
+    if len(pdf_data) > MAX_EXPECTED_PDF_SIZE:
+        logger.warning(f"[PDF_CREATOR] PDF is unusually large ({len(pdf_data):,} bytes), check stream compression")
     
-    # ensure downloads directory exists
-    downloads_dir = Path("static/downloads")
-    downloads_dir.mkdir(parents=True, exist_ok=True)
-    logger.debug(f"[PDF_CREATOR] Downloads directory: {downloads_dir.absolute()} (exists: {downloads_dir.exists()})")
+    downloads_dir = DOWNLOADS_DIR
+    logger.debug("[PDF_CREATOR] Downloads directory: %s", downloads_dir)
     
     # generate unique download id
     download_id = _generate_download_id(buyer_name, company_name, generation_id)
@@ -43,63 +50,51 @@ async def create_invoice_pdf(
     
     logger.info(f"[PDF_CREATOR] Generated download ID: {download_id}")
     logger.info(f"[PDF_CREATOR] Creating PDF package: {pdf_filename}")
-    logger.debug(f"[PDF_CREATOR] Full PDF path: {pdf_path.absolute()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        # absolute() reads the cwd, so only resolve it when the line is emitted
+        logger.debug("[PDF_CREATOR] Full PDF path: %s", pdf_path.absolute())
     
     try:
         # save pdf file
-        logger.debug(f"[PDF_CREATOR] Writing PDF file to: {pdf_path}")
-        with open(pdf_path, 'wb') as f:
-            f.write(pdf_data)
+        logger.debug("[PDF_CREATOR] Writing PDF file to: %s", pdf_path)
+        # disk writes run in a thread so they do not stall the event loop
+        written = await asyncio.to_thread(_write_bytes, pdf_path, pdf_data)
         
-        # verify file was written correctly
-        if pdf_path.exists():
-            actual_size = pdf_path.stat().st_size
-            logger.info(f"[PDF_CREATOR] PDF file saved successfully: {actual_size:,} bytes")
-            if actual_size != len(pdf_data):
-                logger.warning(f"[PDF_CREATOR] Size mismatch: expected {len(pdf_data):,}, got {actual_size:,}")
-        else:
-            logger.error(f"[PDF_CREATOR] PDF file not found after write operation!")
+        # os.write raises on failure, so the byte count is all the verification needed (no stat)
+        if written != len(pdf_data):
+            logger.error(f"[PDF_CREATOR] Short write: expected {len(pdf_data):,}, wrote {written:,}")
             raise Exception("Failed to save PDF file")
+        logger.info(f"[PDF_CREATOR] PDF file saved successfully: {written:,} bytes")
         
         # create download record
-        logger.debug(f"[PDF_CREATOR] Creating download record")
+        logger.debug("[PDF_CREATOR] Creating download record")
+        created_at = datetime.now()
+        expires_at = created_at + DOWNLOAD_TTL
         download_record = {
             "id": download_id,
             "generation_id": generation_id,
-            "created_at": datetime.now().isoformat(),
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat(),
+            "created_at": created_at.isoformat(),
+            "expires_at": expires_at.isoformat(),
             "buyer_name": buyer_name,
             "company_name": company_name,
             "amount": amount,
             "date": date,
             "pdf_size": len(pdf_data),
             "pdf_filename": pdf_filename,
-            "invoice_number": f"INV-{generation_id.split('_')[1] if '_' in generation_id else generation_id}",
+            "invoice_number": f"INV-{generation_id.partition('_')[2] or generation_id}",
             "type": "invoice_pdf"
         }
-        logger.debug(f"[PDF_CREATOR] Record data: {download_record}")
+        logger.debug("[PDF_CREATOR] Record data: %s", download_record)
         
         # save download record
-        record_path = downloads_dir / f"{download_id}.json"
-        logger.debug(f"[PDF_CREATOR] Saving record to: {record_path}")
-        with open(record_path, 'w') as f:
-            json.dump(download_record, f, indent=2)
-        
-        # verify record was saved
-        if record_path.exists():
-            logger.debug(f"[PDF_CREATOR] Record file saved successfully: {record_path.stat().st_size} bytes")
-        else:
-            logger.error(f"[PDF_CREATOR] Record file not found after write operation!")
-            raise Exception("Failed to save download record")
+        await asyncio.to_thread(download_store.insert, download_record)
+        logger.debug("[PDF_CREATOR] Record saved to download store")
         
-        # construct download url (prefer .env, fallback system env)
-        env_vars = dotenv_values(".env")
-        base_url = env_vars.get("DOWNLOAD_BASE_URL") or os.environ.get("DOWNLOAD_BASE_URL", "http://localhost:8086")
-        download_url = f"{base_url}/download/{download_id}"
+        # construct download url
+        download_url = f"{DOWNLOAD_BASE_URL}/download/{download_id}"
         
         logger.info(f"[PDF_CREATOR] PDF package created successfully:")
-        logger.info(f"[PDF_CREATOR]   - File: {pdf_path.name} ({pdf_path.stat().st_size:,} bytes)")
-        logger.info(f"[PDF_CREATOR]   - Record: {record_path.name}")
+        logger.info(f"[PDF_CREATOR]   - File: {pdf_path.name} ({written:,} bytes)")
         logger.info(f"[PDF_CREATOR]   - Download URL: {download_url}")
         logger.info(f"[PDF_CREATOR]   - Download ID: {download_id}")
         
@@ -110,106 +105,72 @@ async def create_invoice_pdf(
         logger.error(f"[PDF_CREATOR] Exception details: {traceback.format_exc()}")
         # clean up partial files
         try:
-            if pdf_path.exists():
-                pdf_path.unlink()
-                logger.debug(f"[PDF_CREATOR] Cleaned up partial PDF file: {pdf_path}")
-            record_path = downloads_dir / f"{download_id}.json"
-            if record_path.exists():
-                record_path.unlink()
-                logger.debug(f"[PDF_CREATOR] Cleaned up partial record file: {record_path}")
+            pdf_path.unlink(missing_ok=True)
+            logger.debug("[PDF_CREATOR] Cleaned up partial PDF file: %s", pdf_path)
+            download_store.delete(download_id)
         except Exception as cleanup_error:
             logger.warning(f"[PDF_CREATOR] Failed to clean up partial files: {cleanup_error}")
         raise
 
 
+# raw fd writes skip the buffered io layer; flags missing on a platform are 0
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0)
+
+
+def _write_bytes(path: Path, data: bytes) -> int:
+    """write bytes to a file through a single descriptor, without extra copies."""
+    fd = os.open(path, _WRITE_FLAGS, 0o644)
+    try:
+        view = memoryview(data)
+        written = 0
+        # os.write may write less than asked, so loop over the unwritten tail
+        while written < len(view):
+            written += os.write(fd, view[written:])
+        return written
+    finally:
+        os.close(fd)
+
+
 def _generate_download_id(buyer_name: str, company_name: str, generation_id: str) -> str:
     """generate a unique download id."""
     # Create a hash from buyer, company, generation ID, and current time
     content = f"{buyer_name}{company_name}{generation_id}{time.time()}".encode()
-    download_id = hashlib.sha256(content).hexdigest()[:16]
-    logger.debug(f"[PDF_CREATOR] Generated download ID: {download_id} from content hash")
-    return download_id
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
 
 
 def cleanup_expired_pdf_downloads(max_age_hours: int = 24) -> int:
     """clean up expired pdf download files."""
-    downloads_dir = Path("static/downloads")
-    if not downloads_dir.exists():
-        return 0
-    
+    # the directory always exists (download_store creates it), so no exists() probe
+    downloads_dir = DOWNLOADS_DIR
     cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-    cleaned_count = 0
+    cleaned_ids = []
     
     logger.info(f"Cleaning up PDF downloads older than {max_age_hours} hours")
     
-    # clean up pdf files and their records
-    for json_file in downloads_dir.glob("*.json"):
+    # candidates come from the indexed store query, not a directory listing
+    for record in download_store.list_created_before(cutoff_time.isoformat(), "invoice_pdf"):
+        download_id = record["id"]
         try:
-            with open(json_file) as f:
-                record = json.load(f)
+            # Remove pdf file
+            pdf_filename = record.get("pdf_filename")
+            if pdf_filename:
+                pdf_path = downloads_dir / pdf_filename
+                pdf_path.unlink(missing_ok=True)
+                logger.debug("Removed expired PDF: %s", pdf_filename)
             
-            # only process invoice PDF records
-            if record.get("type") != "invoice_pdf":
-                continue
+            cleaned_ids.append(download_id)
             
-            created_at = datetime.fromisoformat(record["created_at"])
-            if created_at < cutoff_time:
-                # Remove pdf file
-                pdf_filename = record.get("pdf_filename")
-                if pdf_filename:
-                    pdf_path = downloads_dir / pdf_filename
-                    if pdf_path.exists():
-                        pdf_path.unlink()
-                        logger.debug(f"Removed expired PDF: {pdf_filename}")
-                
-                # Remove record file
-                json_file.unlink()
-                logger.debug(f"Removed expired record: {json_file.name}")
-                cleaned_count += 1
-                
         except Exception as e:
-            logger.warning(f"Error processing {json_file}: {e}")
-            # Remove corrupted record files
-            try:
-                json_file.unlink()
-                cleaned_count += 1
-            except:
-                pass
+            logger.warning(f"Error processing {download_id}: {e}")
     
-    logger.info(f"Cleaned up {cleaned_count} expired PDF downloads")
-    return cleaned_count
+    # drop the records in a few batched statements rather than one per file
+    download_store.delete_many(cleaned_ids)
+    
+    logger.info(f"Cleaned up {len(cleaned_ids)} expired PDF downloads")
+    return len(cleaned_ids)
 
 
 def get_pdf_download_stats() -> Dict:
     """get statistics about current pdf downloads."""
-    downloads_dir = Path("static/downloads")
-    if not downloads_dir.exists():
-        return {"total_pdfs": 0, "total_size": 0, "active_pdfs": 0}
-    
-    total_pdfs = 0
-    total_size = 0
-    active_pdfs = 0
-    
-    for pdf_file in downloads_dir.glob("*.pdf"):
-        if pdf_file.name.startswith("invoice_"):
-            total_pdfs += 1
-            total_size += pdf_file.stat().st_size
-            
-            # check if still active (not expired)
-            download_id = pdf_file.stem.replace('invoice_', '')
-            record_file = downloads_dir / f"{download_id}.json"
-            if record_file.exists():
-                try:
-                    with open(record_file) as f:
-                        record = json.load(f)
-                    expires_at = datetime.fromisoformat(record["expires_at"])
-                    if expires_at > datetime.now():
-                        active_pdfs += 1
-                except:
-                    pass
-    
-    return {
-        "total_pdfs": total_pdfs,
-        "total_size": total_size,
-        "active_pdfs": active_pdfs
-    }
+    # one aggregate query over the store instead of a directory scan
+    return download_store.pdf_stats(datetime.now().isoformat())
@@ -4,8 +4,8 @@ zip creator for mcp code generator
 creates downloadable zip packages containing generated mcp projects.
 """
 
+import asyncio
 import hashlib
-import json
 import logging
 import os
 import time
@@ -13,16 +13,20 @@ import zipfile
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict
-from dotenv import dotenv_values
+
+import orjson
+
+from .download_store import DOWNLOAD_BASE_URL, DOWNLOADS_DIR, download_store
 
 logger = logging.getLogger(__name__)
 
+# how long a download link stays valid
+DOWNLOAD_TTL = timedelta(hours=24)
+
 
 async def create_download_zip(files: Dict[str, str], prompt: str, generation_id: str) -> str:
     """create a downloadable zip package containing all generated files."""
-    # ensure downloads directory exists
-    downloads_dir = Path("static/downloads")
-    downloads_dir.mkdir(parents=True, exist_ok=True)
+    downloads_dir = DOWNLOADS_DIR
     
     # generate unique download id
     download_id = _generate_download_id(prompt, generation_id)
@@ -32,54 +36,57 @@ async def create_download_zip(files: Dict[str, str], prompt: str, generation_id:
     logger.info(f"[{generation_id}] creating zip package: {zip_filename}")
     
     try:
-        # create zip file with all generated files
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for filename, content in files.items():
-                zipf.writestr(filename, content)
-                logger.debug(f"[{generation_id}] added {filename} to zip ({len(content)} bytes)")
-            
-            # add generation metadata
-            metadata = _create_metadata(prompt, generation_id, files)
-            zipf.writestr("GENERATION_INFO.json", json.dumps(metadata, indent=2))
+        # compressing and writing the archive is blocking work, so it runs in a thread
+        zip_size = await asyncio.to_thread(_write_zip, zip_path, files, prompt, generation_id)
         
-        # create download record
+        # create download record (one clock read for both timestamps)
+        created_at = datetime.now()
         download_record = {
             "id": download_id,
             "generation_id": generation_id,
-            "created_at": datetime.now().isoformat(),
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat(),
+            "created_at": created_at.isoformat(),
+            "expires_at": (created_at + DOWNLOAD_TTL).isoformat(),
             "prompt": prompt[:200],  # Truncated for storage
             "file_count": len(files),
-            "zip_size": zip_path.stat().st_size,
+            "zip_size": zip_size,
             "zip_filename": zip_filename
         }
         
         # save download record
-        record_path = downloads_dir / f"{download_id}.json"
-        with open(record_path, 'w') as f:
-            json.dump(download_record, f, indent=2)
+        await asyncio.to_thread(download_store.insert, download_record)
         
-        # construct download url (prefer .env, fallback system env)
-        env_vars = dotenv_values(".env")
-        base_url = env_vars.get("DOWNLOAD_BASE_URL") or os.environ.get("DOWNLOAD_BASE_URL", "http://localhost:8086")
-        download_url = f"{base_url}/download/{download_id}"
+        # construct download url
+        download_url = f"{DOWNLOAD_BASE_URL}/download/{download_id}"
         
-        logger.info(f"[{generation_id}] zip package created: {zip_path.stat().st_size:,} bytes")
+        logger.info(f"[{generation_id}] zip package created: {zip_size:,} bytes")
         return download_url
         
     except Exception as e:
         logger.error(f"[{generation_id}] failed to create zip package: {e}")
         # clean up partial files
-        if zip_path.exists():
-            zip_path.unlink()
+        zip_path.unlink(missing_ok=True)
         raise
 
 
+def _write_zip(zip_path: Path, files: Dict[str, str], prompt: str, generation_id: str) -> int:
+    """write the package archive and return its size in bytes."""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for filename, content in files.items():
+            zipf.writestr(filename, content)
+            logger.debug("[%s] added %s to zip (%s bytes)", generation_id, filename, len(content))
+        
+        # add generation metadata
+        metadata = _create_metadata(prompt, generation_id, files)
+        zipf.writestr("GENERATION_INFO.json", orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    
+    return zip_path.stat().st_size
+
+
 def _generate_download_id(prompt: str, generation_id: str) -> str:
     """generate a unique download id."""
     # Create a hash from prompt, generation ID, and current time
     content = f"{prompt}{generation_id}{time.time()}".encode()
-    return hashlib.sha256(content).hexdigest()[:16]
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
 
 
 def _create_metadata(prompt: str, generation_id: str, files: Dict[str, str]) -> Dict:
@@ -154,7 +161,7 @@ def _get_file_description(filename: str) -> str:
 
 def cleanup_expired_downloads(max_age_hours: int = 24) -> int:
     """clean up expired download files."""
-    downloads_dir = Path("static/downloads")
+    downloads_dir = DOWNLOADS_DIR
     if not downloads_dir.exists():
         return 0
     
@@ -164,34 +171,23 @@ def cleanup_expired_downloads(max_age_hours: int = 24) -> int:
     logger.info(f"Cleaning up downloads older than {max_age_hours} hours")
     
     # clean up zip files and their records
-    for json_file in downloads_dir.glob("*.json"):
+    for record in download_store.list_created_before(cutoff_time.isoformat()):
+        download_id = record["id"]
         try:
-            with open(json_file) as f:
-                record = json.load(f)
+            # Remove zip file
+            zip_filename = record.get("zip_filename")
+            if zip_filename:
+                zip_path = downloads_dir / zip_filename
+                zip_path.unlink(missing_ok=True)
+                logger.debug("Removed expired zip: %s", zip_filename)
+            
+            # Remove record
+            download_store.delete(download_id)
+            logger.debug(f"Removed expired record: {download_id}")
+            cleaned_count += 1
             
-            created_at = datetime.fromisoformat(record["created_at"])
-            if created_at < cutoff_time:
-                # Remove zip file
-                zip_filename = record.get("zip_filename")
-                if zip_filename:
-                    zip_path = downloads_dir / zip_filename
-                    if zip_path.exists():
-                        zip_path.unlink()
-                        logger.debug(f"Removed expired zip: {zip_filename}")
-                
-                # Remove record file
-                json_file.unlink()
-                logger.debug(f"Removed expired record: {json_file.name}")
-                cleaned_count += 1
-                
         except Exception as e:
-            logger.warning(f"Error processing {json_file}: {e}")
-            # Remove corrupted record files
-            try:
-                json_file.unlink()
-                cleaned_count += 1
-            except:
-                pass
+            logger.warning(f"Error processing {download_id}: {e}")
     
     logger.info(f"Cleaned up {cleaned_count} expired downloads")
     return cleaned_count
@@ -199,29 +195,30 @@ def cleanup_expired_downloads(max_age_hours: int = 24) -> int:
 
 def get_download_stats() -> Dict:
     """get statistics about current downloads."""
-    downloads_dir = Path("static/downloads")
-    if not downloads_dir.exists():
+    downloads_dir = DOWNLOADS_DIR
+    try:
+        entries = os.scandir(downloads_dir)
+    except FileNotFoundError:
         return {"total_downloads": 0, "total_size": 0, "active_downloads": 0}
     
     total_downloads = 0
     total_size = 0
     active_downloads = 0
+    now = datetime.now().isoformat()
+    expiries = download_store.expiry_map()
     
-    for zip_file in downloads_dir.glob("*.zip"):
-        total_downloads += 1
-        total_size += zip_file.stat().st_size
-        
-        # check if still active (not expired)
-        record_file = downloads_dir / f"{zip_file.stem.replace('mcp_', '')}.json"
-        if record_file.exists():
-            try:
-                with open(record_file) as f:
-                    record = json.load(f)
-                expires_at = datetime.fromisoformat(record["expires_at"])
-                if expires_at > datetime.now():
-                    active_downloads += 1
-            except:
-                pass
+    # scandir entries carry their type from the directory read, so filtering costs no extra stat
+    with entries:
+        for entry in entries:
+            if not (entry.name.endswith(".zip") and entry.is_file(follow_symlinks=False)):
+                continue
+            total_downloads += 1
+            total_size += entry.stat().st_size
+            
+            # check if still active (not expired)
+            expires_at = expiries.get(entry.name[:-4].replace('mcp_', ''))
+            if expires_at and expires_at > now:
+                active_downloads += 1
     
     return {
         "total_downloads": total_downloads,